@@ -31,7 +31,11 @@ from sugar3.graphics.toggletoolbutton import ToggleToolButton
 from sugar3.graphics.palette import Palette
 from gettext import gettext as _
 
-from view.game_engine import GameEngine, GameMode, Region, Config
+from view.game_engine import (
+    GameEngine, GameMode, Region, Config, MIN_LABEL_FONT_SIZE)
+from view.geometry import (
+    lod_for_scale, polygon_bbox, region_holes, region_parts)
+from view.level_loader import get_level_index, get_level_regions
 from view.map_data import LEVELS
 
 class FourColorMap(activity.Activity):
@@ -294,7 +298,14 @@ class FourColorMap(activity.Activity):
         """Start a game level"""
         try:
             self.current_level = level_data
-            self.current_level_regions = None
+            try:
+                self.current_level_regions = get_level_regions(level_data)
+                self.level_index = get_level_index(
+                    level_data, self.current_level_regions)
+            except Exception as e:
+                print(f"Error loading level: {e}")
+                self.current_level_regions = []
+                self.level_index = None
             self.region_colors = {}
             self.selected_color = 0
 
@@ -390,7 +401,7 @@ class FourColorMap(activity.Activity):
             if self.is_panning:
                 return False
                 
-            if not hasattr(self, 'current_level_regions') or not self.current_level_regions:
+            if not getattr(self, 'current_level_regions', None) or not self.level_index:
                 return False
                 
             adjusted_x = event.x - self.pan_offset_x
@@ -404,32 +415,31 @@ class FourColorMap(activity.Activity):
             map_x = (adjusted_x - base_offset_x) / (base_scale * current_zoom)
             map_y = (adjusted_y - base_offset_y) / (base_scale * current_zoom)
             
-            for region in self.current_level_regions:
-                if self._point_in_region(map_x, map_y, region.get('points', [])):
-                    region_id = region.get('id')
-                    region_name = region.get('name', f'Region {region_id}')
-                    
-                    self._save_undo_state()
-                    
-                    if hasattr(self, 'eraser_button') and self.eraser_button.get_active():
-                        if region_id in self.region_colors:
-                            del self.region_colors[region_id]
-                        else:
-                            self._remove_last_undo_state()
-                            return True
+            for region in self.level_index.regions_at(self.current_level_regions, map_x, map_y):
+                region_id = region.get('id')
+                region_name = region.get('name', f'Region {region_id}')
+                
+                self._save_undo_state()
+                
+                if hasattr(self, 'eraser_button') and self.eraser_button.get_active():
+                    if region_id in self.region_colors:
+                        del self.region_colors[region_id]
                     else:
-                        old_color = self.region_colors.get(region_id)
-                        new_color = self.selected_color
-                        
-                        if old_color == new_color:
-                            self._remove_last_undo_state()
-                            return True
-                            
-                        self.region_colors[region_id] = new_color
-                        color_name = ['Red', 'Green', 'Blue', 'Yellow'][new_color]
+                        self._remove_last_undo_state()
+                        return True
+                else:
+                    old_color = self.region_colors.get(region_id)
+                    new_color = self.selected_color
                     
-                    widget.queue_draw()
-                    return True
+                    if old_color == new_color:
+                        self._remove_last_undo_state()
+                        return True
+                        
+                    self.region_colors[region_id] = new_color
+                    color_name = ['Red', 'Green', 'Blue', 'Yellow'][new_color]
+                
+                widget.queue_draw()
+                return True
             return True
         except Exception as e:
             return False
@@ -472,24 +482,6 @@ class FourColorMap(activity.Activity):
         except Exception as e:
             print(f"Error during undo: {e}")
 
-    def _point_in_region(self, x, y, points):
-        """Check if point is inside region using ray casting"""
-        if len(points) < 3:
-            return False
-            
-        inside = False
-        j = len(points) - 1
-        
-        for i in range(len(points)):
-            xi, yi = points[i]
-            xj, yj = points[j]
-            
-            if ((yi > y) != (yj > y)) and (x < (xj - xi) * (y - yi) / (yj - yi) + xi):
-                inside = not inside
-            j = i
-            
-        return inside
-
     def _draw_game_placeholder(self, widget, cr, level_data):
         """Draw the actual game map from level data"""
         try:
@@ -505,14 +497,10 @@ class FourColorMap(activity.Activity):
             cr.rectangle(0, 0, width, height)
             cr.stroke()
             
-            regions = []
-            if 'data_func' in level_data:
-                try:
-                    regions = level_data['data_func']()
-                except Exception as e:
-                    regions = []
-            elif 'regions' in level_data:
-                regions = level_data['regions']
+            regions = getattr(self, 'current_level_regions', None) or []
+            level_index = getattr(self, 'level_index', None)
+            anchors = level_index.anchors if level_index else None
+            label_widths = level_index.label_widths if level_index else None
             
             if not regions:
                 cr.set_source_rgb(0.4, 0.4, 0.4)
@@ -528,18 +516,21 @@ class FourColorMap(activity.Activity):
                 cr.show_text(text)
                 return False
             
-            all_points = []
-            for region in regions:
-                points = region.get('points', [])
-                all_points.extend(points)
+            # Map bounds from the index's region bounding boxes, so the
+            # full geometry is not walked every frame
+            if level_index:
+                boxes = [box for box in level_index.bboxes if box]
+            else:
+                boxes = [polygon_bbox(ring) for region in regions
+                         for ring in region_parts(region) if len(ring)]
             
-            if not all_points:
+            if not boxes:
                 return False
             
-            min_x = min(p[0] for p in all_points)
-            max_x = max(p[0] for p in all_points)
-            min_y = min(p[1] for p in all_points)
-            max_y = max(p[1] for p in all_points)
+            min_x = min(box[0] for box in boxes)
+            min_y = min(box[1] for box in boxes)
+            max_x = max(box[2] for box in boxes)
+            max_y = max(box[3] for box in boxes)
             
             padding = 40
             map_width = max_x - min_x
@@ -575,11 +566,17 @@ class FourColorMap(activity.Activity):
                 if len(points) < 3:
                     continue
                 
-                screen_points = []
-                for x, y in points:
-                    screen_x = x * scale + offset_x
-                    screen_y = y * scale + offset_y
-                    screen_points.append((screen_x, screen_y))
+                # Islands and exclaves after the main part, and the
+                # holes (enclaves) of every part, from the coarsest
+                # detail level within a pixel of the full geometry
+                detail = lod_for_scale(region.get('lods'), scale) or region
+                screen_parts = []
+                for part, holes in zip(region_parts(detail), region_holes(detail)):
+                    if len(part) < 3:
+                        continue
+                    for ring in [part, *holes]:
+                        screen_parts.append([(x * scale + offset_x, y * scale + offset_y)
+                                             for x, y in ring])
                 
                 if hasattr(self, 'region_colors') and region.get('id') in self.region_colors:
                     color_index = self.region_colors[region.get('id')]
@@ -589,10 +586,12 @@ class FourColorMap(activity.Activity):
                     cr.set_source_rgba(0.9, 0.9, 0.9, 1.0)
                 
                 cr.new_path()
-                cr.move_to(screen_points[0][0], screen_points[0][1])
-                for point in screen_points[1:]:
-                    cr.line_to(point[0], point[1])
-                cr.close_path()
+                for part_points in screen_parts:
+                    cr.move_to(part_points[0][0], part_points[0][1])
+                    for point in part_points[1:]:
+                        cr.line_to(point[0], point[1])
+                    cr.close_path()
+                cr.set_fill_rule(cairo.FILL_RULE_EVEN_ODD)
                 cr.fill_preserve()
                 
                 cr.set_source_rgb(0.2, 0.2, 0.2)
@@ -600,15 +599,23 @@ class FourColorMap(activity.Activity):
                 cr.stroke()
                 
                 region_name = region.get('name', f'Region {region.get("id", i+1)}')
-                if region_name and screen_points:
-                    center_x = sum(p[0] for p in screen_points) / len(screen_points)
-                    center_y = sum(p[1] for p in screen_points) / len(screen_points)
+                if region_name and anchors and anchors[i]:
+                    center_x = anchors[i][0] * scale + offset_x
+                    center_y = anchors[i][1] * scale + offset_y
                     
                     cr.set_source_rgb(0, 0, 0)
                     cr.select_font_face("Sans", 0, 0)
-                    cr.set_font_size(max(10, min(16, scale * 12)))
+                    font_size = max(10, min(16, scale * 12))
+                    cr.set_font_size(font_size)
                     
                     text_extents = cr.text_extents(region_name)
+                    # Shrink the text to the room around the anchor
+                    max_width = label_widths[i] * scale
+                    if max_width > 0 and text_extents.width > max_width:
+                        cr.set_font_size(max(
+                            MIN_LABEL_FONT_SIZE,
+                            font_size * max_width / text_extents.width))
+                        text_extents = cr.text_extents(region_name)
                     text_x = center_x - text_extents.width/2
                     text_y = center_y + text_extents.height/2
                     
@@ -665,21 +672,8 @@ class FourColorMap(activity.Activity):
     def _check_for_conflicts(self):
         """Check if there are any color conflicts between adjacent regions"""
         try:
-            adjacencies = {}
-            
-            for region in self.current_level_regions:
-                region_id = region.get('id')
-                neighbors = region.get('neighbors', [])
-                adjacencies[region_id] = neighbors
-            
-            for region_id, color in self.region_colors.items():
-                neighbors = adjacencies.get(region_id, [])
-                for neighbor_id in neighbors:
-                    if neighbor_id in self.region_colors:
-                        if self.region_colors[neighbor_id] == color:
-                            return True
-            return False
-            
+            return bool(self.level_index.graph.conflicts(self.region_colors))
+
         except Exception as e:
             print(f"Error checking conflicts: {e}")
             return True
@@ -0,0 +1,440 @@
+# Copyright (C) 2025 Bishoy Wadea
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+Micro-benchmarks for the game and the level tools.
+
+Usage: python -m utils.benchmarks <benchmark> [options]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+COUNTRIES_DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'assets', 'countries data')
+
+
+def synthetic_grid_map(rows, cols, cell=10):
+    """Square grid map with 4-neighbour adjacency, ids in row-major order"""
+    regions = []
+    for row in range(rows):
+        for col in range(cols):
+            x = col * cell
+            y = row * cell
+            neighbors = []
+            if row > 0:
+                neighbors.append((row - 1) * cols + col)
+            if col > 0:
+                neighbors.append(row * cols + col - 1)
+            if col < cols - 1:
+                neighbors.append(row * cols + col + 1)
+            if row < rows - 1:
+                neighbors.append((row + 1) * cols + col)
+            regions.append({
+                'id': row * cols + col,
+                'name': f"Cell {row},{col}",
+                'points': [(x, y), (x + cell, y),
+                           (x + cell, y + cell), (x, y + cell)],
+                'neighbors': neighbors,
+            })
+    return regions
+
+
+def _timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _measure(build):
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+class _DictRegion:
+    """The per-region object model the engine used before RegionStore"""
+
+    def __init__(self, region_id, points, name="", neighbors=None):
+        self.id = region_id
+        self.points = points
+        self.name = name
+        self.color_index = None
+        self.neighbors = set(neighbors or [])
+
+
+def _dict_regions_complete(regions):
+    for region in regions.values():
+        if region.color_index is None:
+            return False
+    for region in regions.values():
+        for neighbor_id in region.neighbors:
+            neighbor = regions.get(neighbor_id)
+            if neighbor and neighbor.color_index == region.color_index:
+                return False
+    return True
+
+
+def bench_region_store(args):
+    from view.game_engine import Region, RegionStore
+    from view.level_loader import LevelIndex
+
+    regions_data = synthetic_grid_map(args.size, args.size)
+    cols = args.size
+    print(f"Synthetic map: {len(regions_data)} regions")
+
+    def build_dict_model():
+        return {
+            region['id']: _DictRegion(
+                region['id'], region['points'], region['name'],
+                region['neighbors'])
+            for region in regions_data
+        }
+
+    def build_store():
+        return RegionStore(regions_data, level_index)
+
+    def build_handles():
+        return {region_id: Region(store, position)
+                for position, region_id in enumerate(store.ids)}
+
+    # Both models share the same region dicts and point lists, so only
+    # the per-region bookkeeping is measured. The level index is shared
+    # input (it is also what the activity uses), built outside the
+    # measurement.
+    level_index = LevelIndex.build(regions_data)
+    dict_model, dict_bytes = _measure(build_dict_model)
+    store, store_bytes = _measure(build_store)
+    handles, handle_bytes = _measure(build_handles)
+
+    # Checkerboard coloring: complete and valid, so both checks have to
+    # look at every region and adjacency
+    for region_id, region in dict_model.items():
+        row, col = divmod(region_id, cols)
+        color = (row + col) % 2
+        region.color_index = color
+        handles[region_id].set_color(color)
+
+    dict_time = _timed(lambda: _dict_regions_complete(dict_model),
+                       args.repeat)
+    store_time = _timed(
+        lambda: store.all_colored() and not store.has_conflict(),
+        args.repeat)
+
+    print(f"{'model':<24}{'memory':>12}{'is_complete':>16}")
+    print(f"{'dict objects':<24}{dict_bytes / 1024:>9.0f} KB"
+          f"{dict_time * 1e6:>13.1f} us")
+    print(f"{'RegionStore':<24}{store_bytes / 1024:>9.0f} KB"
+          f"{store_time * 1e6:>13.1f} us")
+    print(f"{'  + Region handles':<24}{handle_bytes / 1024:>9.0f} KB")
+
+
+def _project_polygons_loop(geometries, tolerance, scale, offset, origin,
+                           max_points):
+    """The per-vertex projection loop the importer used before NumPy"""
+    results = []
+    minx, maxy = origin
+    for geom in geometries:
+        if geom.geom_type == "MultiPolygon":
+            geom = max(geom.geoms, key=lambda g: g.area)
+        geom = geom.simplify(tolerance=tolerance)
+        coords = []
+        for x, y in geom.exterior.coords:
+            screen_x = int((x - minx) * scale + offset[0])
+            screen_y = int((maxy - y) * scale + offset[1])
+            coords.append((screen_x, screen_y))
+        if len(coords) > max_points:
+            step = len(coords) // max_points
+            coords = coords[::step]
+        results.append(coords)
+    return results
+
+
+def bench_projection(args):
+    import geopandas as gpd
+    from utils.parser_countries_json import _polygon_parts, _project_polygons
+
+    path = args.input or os.path.join(COUNTRIES_DATA_DIR, 'in.json')
+    geometries = list(gpd.read_file(path).geometry)
+    # The loop kept only the largest part of each region
+    regions = [_polygon_parts(g)[:1] for g in geometries]
+    minx, miny, maxx, maxy = gpd.GeoSeries(geometries).total_bounds
+    scale = min(640 / (maxx - minx), 420 / (maxy - miny))
+    vertices = sum(len(g.exterior.coords) if g.geom_type == "Polygon" else
+                   sum(len(part.exterior.coords) for part in g.geoms)
+                   for g in geometries)
+    print(f"{os.path.basename(path)}: {len(geometries)} regions, "
+          f"{vertices} vertices")
+
+    # Simplification is part of both timings; tolerance 0 keeps every
+    # vertex so the transform dominates. Vertex reduction is left out:
+    # the loop decimated, the importer now uses Visvalingam-Whyatt
+    for tolerance in (0, max(maxx - minx, maxy - miny) / 1000):
+        params = dict(tolerance=tolerance, scale=scale, offset=(80, 90),
+                      origin=(minx, maxy), max_points=sys.maxsize)
+        loop_time = _timed(
+            lambda: _project_polygons_loop(geometries, **params),
+            args.repeat)
+        array_time = _timed(
+            lambda: _project_polygons(regions, **params), args.repeat)
+        same = _project_polygons_loop(geometries, **params) == \
+            [parts[0][0] for parts in _project_polygons(regions, **params)]
+        print(f"tolerance {tolerance:g}: loop {loop_time * 1e3:.1f} ms, "
+              f"vectorised {array_time * 1e3:.1f} ms "
+              f"({loop_time / array_time:.1f}x), identical output: {same}")
+
+
+def _locality(regions):
+    """Mean position gap between neighbours and span of grid cells"""
+    from view.level_loader import LevelIndex
+
+    index = LevelIndex.build(regions)
+    gaps = [j - i for i, j in index.graph.edges()]
+    cells = [cell for cell in index.grid['cells'] if cell]
+    spans = [(cell[-1] - cell[0] + 1) / len(cell) for cell in cells]
+    return index, sum(gaps) / len(gaps), sum(spans) / len(spans)
+
+
+def bench_region_order(args):
+    import random
+
+    from utils.parser_countries_json import generate_regions_from_geojson
+    from utils.region_order import hilbert_order, reorder_regions
+    from view.game_engine import RegionStore
+
+    grid_map = synthetic_grid_map(args.size, args.size)
+    shuffled = list(range(len(grid_map)))
+    random.Random(0).shuffle(shuffled)
+    # A shuffled grid stands in for dataset order, which is unrelated to
+    # where regions lie
+    scattered = reorder_regions(grid_map, shuffled)
+    orders = {
+        "row-major": grid_map,
+        "shuffled": scattered,
+        "hilbert": reorder_regions(scattered, hilbert_order(scattered)),
+    }
+    print(f"Synthetic map: {len(grid_map)} regions")
+    print(f"{'order':<12}{'neighbour gap':>15}{'cell span':>11}"
+          f"{'neighbour scan':>16}{'cell scan':>11}")
+    for name, regions in orders.items():
+        index, gap, span = _locality(regions)
+        store = RegionStore(regions, index)
+        graph = index.graph
+        colors = store.colors
+        bboxes = store.bboxes
+        cells = index.grid['cells']
+
+        # What a solver does for every region, and a redraw for every
+        # cell it touches
+        def neighbour_scan():
+            for i in range(len(colors)):
+                for j in graph.neighbors(i):
+                    colors[j]
+
+        def cell_scan():
+            for cell in cells:
+                for i in cell:
+                    bboxes[4 * i + 2]
+
+        scan_time = _timed(neighbour_scan, args.repeat)
+        cell_time = _timed(cell_scan, args.repeat)
+        print(f"{name:<12}{gap:>15.1f}{span:>11.2f}"
+              f"{scan_time * 1e3:>13.1f} ms{cell_time * 1e3:>8.1f} ms")
+
+    path = args.input or os.path.join(COUNTRIES_DATA_DIR, 'in.json')
+    imported = generate_regions_from_geojson(path, scale_factor=2.0)
+    print(f"{os.path.basename(path)}: {len(imported)} regions")
+    print(f"{'order':<12}{'neighbour gap':>15}{'cell span':>11}")
+    for name, regions in (
+            ("dataset", imported),
+            ("hilbert", reorder_regions(imported, hilbert_order(imported)))):
+        _, gap, span = _locality(regions)
+        print(f"{name:<12}{gap:>15.1f}{span:>11.2f}")
+
+
+def bench_level_pack(args):
+    from view import map_data
+    from view.level_pack import decode_level, encode_level
+
+    # Built-in levels only: the level functions against decoding the
+    # same regions from a pack
+    print(f"{'level':<16}{'function':>12}{'pack decode':>14}"
+          f"{'pack size':>12}")
+    for level in map_data.LEVELS:
+        data_func = level['data_func']
+        if getattr(data_func, '__module__', None) != map_data.__name__:
+            continue
+        data = encode_level(data_func())
+        function_time = _timed(data_func, args.repeat)
+        decode_time = _timed(lambda: decode_level(data), args.repeat)
+        print(f"{level['name']:<16}{function_time * 1e3:>9.3f} ms"
+              f"{decode_time * 1e3:>11.3f} ms{len(data):>10} B")
+
+
+def bench_readers(args):
+    from utils import parser_countries_json as parser
+
+    paths = [args.input] if args.input else [
+        os.path.join(COUNTRIES_DATA_DIR, name)
+        for name in sorted(os.listdir(COUNTRIES_DATA_DIR))]
+    readers = ["stream", "geopandas"]
+    if parser.pyogrio is not None:
+        readers.insert(0, "pyogrio")
+        arrow = "with" if parser.pyarrow is not None else "without"
+        print(f"pyogrio {arrow} Arrow")
+    else:
+        print("pyogrio is not installed")
+
+    columns = "".join(f"{reader:>12}" for reader in readers)
+    print(f"{'input':<14}{'features':>9}{columns}  same features")
+    for path in paths:
+        # Rounds alternate between the readers, so drift in the
+        # machine's speed does not favour one of them
+        times = [None] * len(readers)
+        for _ in range(args.repeat):
+            for k, reader in enumerate(readers):
+                elapsed = _timed(
+                    lambda: parser.load_features(path, reader=reader), 1)
+                times[k] = elapsed if times[k] is None else min(
+                    times[k], elapsed)
+        frames = [parser.load_features(path, reader=reader)
+                  for reader in readers]
+
+        def features(gdf):
+            name = next(
+                (field for field in parser.NAME_FIELDS if field in gdf),
+                None)
+            names = list(gdf[name]) if name else []
+            return names, gdf.geometry.to_wkb().tolist()
+
+        same = all(features(gdf) == features(frames[0])
+                   for gdf in frames[1:])
+        timings = "".join(f"{elapsed * 1e3:>9.1f} ms" for elapsed in times)
+        print(f"{os.path.basename(path):<14}{len(frames[0]):>9}{timings}"
+              f"  {same}")
+
+
+def bench_import(args):
+    from utils.build_levels import DEFAULT_CONFIG, level_settings
+    from utils.parser_countries_json import generate_regions_from_geojson
+    from utils.profiling import StageProfile
+
+    # One JSON line per input, with the bundled build settings
+    paths = [args.input] if args.input else [
+        os.path.join(COUNTRIES_DATA_DIR, name)
+        for name in sorted(os.listdir(COUNTRIES_DATA_DIR))]
+    for path in paths:
+        params, _ = level_settings(os.path.basename(path), DEFAULT_CONFIG)
+        profile = StageProfile(input=os.path.basename(path),
+                               input_bytes=os.path.getsize(path))
+        generate_regions_from_geojson(path, profile=profile, **params)
+        print(json.dumps(profile.to_dict()))
+
+
+def _import_peak(path, output_format):
+    """
+    Peak traced memory, in bytes, of importing path with the bundled
+    build settings and writing it as a level pack or a region stream
+    """
+    import tempfile
+
+    from utils.build_levels import DEFAULT_CONFIG, level_settings
+    from utils.parser_countries_json import (
+        generate_regions_from_geojson, iter_regions_from_geojson,
+        write_regions_as_level_pack, write_regions_as_region_stream)
+    from utils.profiling import StageProfile
+
+    params, _ = level_settings(os.path.basename(path), DEFAULT_CONFIG)
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, output_format)
+        tracemalloc.start()
+        # The profile resets the peak at every stage, so the import's
+        # peak is the largest of the stages'
+        profile = StageProfile()
+        if output_format == "stream":
+            write_regions_as_region_stream(
+                iter_regions_from_geojson(path, profile=profile, **params),
+                output_path=output_path)
+        else:
+            write_regions_as_level_pack(
+                generate_regions_from_geojson(
+                    path, profile=profile, **params),
+                output_path=output_path)
+        profile.lap("write")
+        peak = max(stage["peak_traced"] for stage in profile.stages)
+        tracemalloc.stop()
+    return peak
+
+
+def bench_import_memory(args):
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Each import runs in a fresh process, so what one leaves cached
+    # does not count against the other. tracemalloc sees Python and
+    # NumPy allocations, not GEOS's.
+    paths = [args.input] if args.input else [
+        os.path.join(COUNTRIES_DATA_DIR, name)
+        for name in sorted(os.listdir(COUNTRIES_DATA_DIR))]
+    print(f"{'input':<14}{'pack':>12}{'stream':>12}")
+    for path in paths:
+        peaks = []
+        for output_format in ("pack", "stream"):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                peaks.append(executor.submit(
+                    _import_peak, path, output_format).result())
+        print(f"{os.path.basename(path):<14}"
+              f"{peaks[0] / 1024:>9.0f} KB{peaks[1] / 1024:>9.0f} KB")
+
+
+BENCHMARKS = {
+    "import": bench_import,
+    "import-memory": bench_import_memory,
+    "level-pack": bench_level_pack,
+    "projection": bench_projection,
+    "readers": bench_readers,
+    "region-order": bench_region_order,
+    "region-store": bench_region_store,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument(
+        "--size", type=int, default=100,
+        help="Synthetic map size (size x size regions)")
+    parser.add_argument(
+        "--input",
+        help="GeoJSON file for the importer benchmarks (default: "
+        "assets/countries data/in.json, or every bundled input)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+# Copyright (C) 2025 Bishoy Wadea
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+Build one level pack from a directory of GeoJSON files.
+
+Every input becomes a level, imported with the parser's settings for
+its region type (REGION_CONFIGS) plus any per-file overrides. Inputs
+are imported in parallel; each imported level is kept in a build cache
+keyed by the hash of the input file and its settings, so unchanged
+inputs are not imported again. Changed inputs reuse the import stages
+that their change does not affect, such as reading and finding
+neighbours after a layout change (see utils/import_cache.py), from the
+stage cache next to it. The pack is written together with its
+index sidecar, ready to be dropped into a level pack directory.
+
+Usage: python -m utils.build_levels [input_dir] [--config FILE]
+           [--output PACK] [--jobs N] [--force]
+
+The config is a JSON object mapping file names to settings, e.g.
+{"us.geojson": {"name": "United States", "region_type": "us_states"}}.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.parser_countries_json import (
+    GEOJSON_EXTENSIONS,
+    GRID_BITS,
+    REGION_CONFIGS,
+    generate_regions_from_geojson,
+    grid_scale,
+)
+from utils.import_cache import StageCache, file_digest
+from view.level_loader import cache_dir, write_pack_index
+from view.level_pack import PACK_EXTENSION, encode_level, write_level_pack
+
+# Bump when importer changes alter the generated levels
+BUILD_VERSION = 8
+
+DEFAULT_INPUT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'assets', 'countries data')
+DEFAULT_OUTPUT = os.path.join('build', f'countries{PACK_EXTENSION}')
+
+# Settings for the bundled inputs
+DEFAULT_CONFIG = {
+    "eg.json": {"name": "Egypt"},
+    "in.json": {"name": "India"},
+    "ng.json": {"name": "Nigeria"},
+    "us.geojson": {"name": "United States", "region_type": "us_states"},
+}
+
+# Importer arguments used unless the region type or the file overrides
+# them
+IMPORT_DEFAULTS = {
+    "scale_factor": 2.0,
+    "screen_width": 800,
+    "screen_height": 600,
+}
+
+
+def level_settings(filename, config):
+    """Importer arguments and level metadata for one input file"""
+    settings = dict(config.get(filename, {}))
+    stem = os.path.splitext(filename)[0]
+    meta = {
+        "name": settings.pop("name", stem.replace("_", " ").title()),
+        "tag": settings.pop("tag", "countries"),
+    }
+    description = settings.pop("description", None)
+    if description:
+        meta["description"] = description
+
+    params = dict(IMPORT_DEFAULTS)
+    region_type = settings.pop("region_type", None)
+    if region_type:
+        params.update(REGION_CONFIGS[region_type])
+    params.update(settings)
+    params["output_name"] = stem
+    return params, meta
+
+
+def input_hash(path, params, meta):
+    """Hash of an input file and everything that shapes its level"""
+    digest = hashlib.sha1(file_digest(path).encode("ascii"))
+    settings = {"build": BUILD_VERSION, "params": params, "meta": meta}
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def build_level(path, params, meta, stage_cache=None):
+    """
+    Import one input and return its encoded level record, keeping its
+    import stages in the stage_cache directory, if given
+    """
+    cache = StageCache(stage_cache, path) if stage_cache else None
+    regions = generate_regions_from_geojson(path, cache=cache, **params)
+    meta = dict(meta)
+    meta.setdefault("description", f"{len(regions)} regions")
+    # Store the coordinates on the importer's grid
+    resolution = grid_scale(params["screen_width"], params["screen_height"],
+                            params.get("grid_bits", GRID_BITS))
+    return encode_level(regions, meta, resolution)
+
+
+def _build_task(task):
+    return build_level(*task)
+
+
+def build_pack(input_dir, output, config, jobs=1, build_cache=None,
+               force=False):
+    """
+    Build a level pack from every GeoJSON file in input_dir.
+
+    Args:
+        input_dir: Directory of input files, one level each, in file name
+            order
+        output: Level pack to write; the index sidecar goes next to it
+        config: Per-file settings (see DEFAULT_CONFIG)
+        jobs: Number of inputs imported at the same time
+        build_cache: Directory for imported levels, keyed by input hash,
+            and (under stages/) their import stages
+        force: Import every input, running every import stage, even if
+            its level is cached
+
+    Returns:
+        (number of levels, number imported)
+    """
+    if build_cache is None:
+        build_cache = os.path.join(cache_dir(), "build")
+    os.makedirs(build_cache, exist_ok=True)
+    # Forced imports run every stage
+    stage_cache = None if force else os.path.join(build_cache, "stages")
+
+    filenames = sorted(
+        name for name in os.listdir(input_dir)
+        if name.lower().endswith(GEOJSON_EXTENSIONS))
+    records = {}
+    tasks = {}
+    cache_paths = {}
+    for filename in filenames:
+        path = os.path.join(input_dir, filename)
+        params, meta = level_settings(filename, config)
+        cache_path = os.path.join(
+            build_cache, f"{input_hash(path, params, meta)}.level")
+        cache_paths[filename] = cache_path
+        if not force and os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                records[filename] = f.read()
+            print(f"{filename}: unchanged")
+        else:
+            tasks[filename] = (path, params, meta, stage_cache)
+
+    if tasks:
+        if jobs > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(
+                    max_workers=min(jobs, len(tasks))) as executor:
+                built = executor.map(_build_task, tasks.values())
+                records.update(zip(tasks, built))
+        else:
+            for filename, task in tasks.items():
+                records[filename] = _build_task(task)
+
+        for filename in tasks:
+            with open(cache_paths[filename], "wb") as f:
+                f.write(records[filename])
+            print(f"{filename}: imported")
+
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    write_level_pack(output, [records[name] for name in filenames])
+    write_pack_index(output)
+    return len(filenames), len(tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build a level pack from a directory of GeoJSON files.")
+    parser.add_argument(
+        "input_dir",
+        nargs="?",
+        default=DEFAULT_INPUT_DIR,
+        help="Directory of GeoJSON files (default: assets/countries data)",
+    )
+    parser.add_argument(
+        "--config",
+        help="JSON file of per-file settings (default: the bundled inputs)",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        default=DEFAULT_OUTPUT,
+        help=f"Level pack to write (default: {DEFAULT_OUTPUT})",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        metavar="N",
+        help="Import N files at a time (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Import every file, even if unchanged",
+    )
+    args = parser.parse_args()
+
+    config = DEFAULT_CONFIG
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+
+    count, imported = build_pack(
+        args.input_dir, args.output, config, args.jobs, force=args.force)
+    print(f"✅ Wrote {count} levels to {args.output} "
+          f"({imported} imported, {count - imported} unchanged)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# Copyright (C) 2025 Bishoy Wadea
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+Streaming GeoJSON reader for the importer.
+
+A FeatureCollection is read in chunks and its features are decoded one
+at a time, so only the current feature and the features that pass the
+filter are ever held in memory, not the whole document or a
+GeoDataFrame of every feature.
+"""
+
+import json
+
+import geopandas as gpd
+from shapely.geometry import shape
+
+CHUNK_SIZE = 1 << 16
+
+# GeoJSON without a "crs" member is WGS84 (RFC 7946)
+DEFAULT_CRS = "EPSG:4326"
+WGS84_NAMES = (
+    "urn:ogc:def:crs:OGC:1.3:CRS84",
+    "urn:ogc:def:crs:OGC::CRS84",
+    "OGC:CRS84",
+    "CRS84",
+)
+
+
+class _Reader:
+    """Character buffer over a text file that refills on demand"""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=None):
+        """Read more text, dropping what has been consumed"""
+        if self.eof:
+            return False
+        chunk = self.f.read(max(size or 0, self.chunk_size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, without consuming it"""
+        while True:
+            while self.pos < len(self.buffer) and \
+                    self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(
+                f"Expected {char!r} in GeoJSON, found {self.peek()!r}")
+        self.pos += 1
+
+    def value(self, decoder):
+        """Decode the next JSON value, reading as much as it needs"""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Grow geometrically so large features decode in
+                # linear time
+                if not self.fill(len(self.buffer) - self.pos):
+                    raise
+                continue
+            # A number may continue in the next chunk
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_features(path, chunk_size=CHUNK_SIZE, members=None):
+    """
+    Yield the features of a GeoJSON FeatureCollection one at a time.
+
+    Args:
+        path: GeoJSON file
+        chunk_size: Characters read at a time
+        members: Optional dict that receives the collection's other
+            top-level members (such as "crs") as they are read
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        reader = _Reader(f, chunk_size)
+        reader.expect("{")
+        while reader.peek() != "}":
+            key = reader.value(decoder)
+            reader.expect(":")
+            if key != "features":
+                value = reader.value(decoder)
+                if members is not None:
+                    members[key] = value
+            else:
+                reader.expect("[")
+                while reader.peek() != "]":
+                    yield reader.value(decoder)
+                    if reader.peek() == ",":
+                        reader.expect(",")
+                reader.expect("]")
+            if reader.peek() == ",":
+                reader.expect(",")
+            elif reader.peek() == "":
+                raise ValueError("GeoJSON ended early")
+
+
+def _crs_name(members):
+    crs = members.get("crs") or {}
+    name = (crs.get("properties") or {}).get("name")
+    if not name or name in WGS84_NAMES:
+        return DEFAULT_CRS
+    return name
+
+
+def read_geojson(path, keep=None, columns=None, chunk_size=CHUNK_SIZE):
+    """
+    Read the matching features of a GeoJSON file into a GeoDataFrame.
+
+    Args:
+        path: GeoJSON file
+        keep: Optional function of a feature's properties dict; features
+            it rejects are skipped before their geometry is built
+        columns: Property names to keep (None keeps all)
+        chunk_size: Characters read at a time
+
+    Returns:
+        GeoDataFrame with one row per kept feature
+    """
+    members = {}
+    rows = []
+    geometries = []
+    for feature in iter_features(path, chunk_size, members):
+        properties = feature.get("properties") or {}
+        if keep is not None and not keep(properties):
+            continue
+        if feature.get("geometry") is None:
+            continue
+        if columns is not None:
+            properties = {name: properties[name]
+                          for name in columns if name in properties}
+        rows.append(properties)
+        geometries.append(shape(feature["geometry"]))
+
+    return gpd.GeoDataFrame(rows, geometry=geometries,
+                            crs=_crs_name(members))
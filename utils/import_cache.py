@@ -0,0 +1,92 @@
+# Copyright (C) 2025 Bishoy Wadea
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+On-disk cache of the intermediate results of an import.
+
+Reading, reprojecting, simplifying and finding neighbours do not depend
+on the map's layout (its scale and where insets go), so their results
+are kept per stage, keyed by the hash of the input file and the
+parameters that stage does depend on. Re-importing after a layout-only
+change then only re-runs the screen transform and what follows it.
+
+Results are pickled; a cache file that cannot be read is recomputed.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+
+# Bump when a cached stage's results change shape or meaning
+STAGE_CACHE_VERSION = 2
+
+
+def file_digest(path):
+    """SHA-1 hex digest of a file's contents"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StageCache:
+    """Cached import stage results for one input file"""
+
+    def __init__(self, directory, input_path):
+        self.directory = directory
+        self.input_digest = file_digest(input_path)
+
+    def path(self, stage, params):
+        """Cache file of a stage run with the given JSON-able params"""
+        key = json.dumps({
+            "version": STAGE_CACHE_VERSION,
+            "input": self.input_digest,
+            "stage": stage,
+            "params": params,
+        }, sort_keys=True)
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{stage}-{digest}.pickle")
+
+    def get(self, stage, params, compute):
+        """
+        The cached result of a stage, or compute() stored for next time.
+
+        Returns (result, cached), cached telling whether it was read
+        from the cache.
+        """
+        path = self.path(stage, params)
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f), True
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            # A truncated or stale pickle can fail in almost any way
+            # (AttributeError, ImportError, ValueError, ...)
+            print(f"Could not read import cache {path}: {e}")
+
+        result = compute()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            partial_path = f"{path}.{os.getpid()}.tmp"
+            with open(partial_path, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(partial_path, path)
+        except OSError as e:
+            print(f"Could not write import cache {path}: {e}")
+        return result, False
@@ -0,0 +1,43 @@
+# Copyright (C) 2025 Bishoy Wadea
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+Chunked work in worker processes, shared by the level tools.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+def map_chunks(func, items, jobs, executor=None):
+    """
+    Apply func to consecutive chunks of items and join the results.
+
+    With jobs > 1 the chunks run in executor, or in a process pool
+    started for this call; results are joined in input order, so the
+    output does not depend on the number of jobs.
+    """
+    if jobs <= 1 or len(items) < 2:
+        return func(items)
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return map_chunks(func, items, jobs, executor)
+
+    size = -(-len(items) // jobs)
+    chunks = [items[k:k + size] for k in range(0, len(items), size)]
+    results = []
+    for chunk_result in executor.map(func, chunks):
+        results.extend(chunk_result)
+    return results
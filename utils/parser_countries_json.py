@@ -14,11 +14,232 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
+import argparse
 import geopandas as gpd
+import math
+import numpy as np
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import shapely
+from shapely import STRtree
+from shapely.errors import GEOSException
+from shapely.geometry import MultiLineString, MultiPolygon, Polygon
+from shapely.ops import polylabel
 
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
 
-def generate_regions_from_geojson(
+try:
+    # Lets pyogrio hand over columns through Arrow
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from utils.geojson_stream import read_geojson
+from utils.import_cache import StageCache
+from utils.parallel import map_chunks
+from utils.profiling import StageProfile
+from utils.region_order import centroid_order, region_centroids
+from utils.topology import (
+    find_border_gaps,
+    reduce_ring,
+    simplify_shared_borders,
+)
+
+from view.geometry import (
+    label_anchor,
+    label_width,
+    region_holes,
+    region_parts,
+)
+from view.level_pack import (
+    PACK_EXTENSION,
+    STREAM_EXTENSION,
+    RegionStreamWriter,
+    encode_level,
+    write_level_pack,
+)
+
+GEOJSON_EXTENSIONS = (".json", ".geojson")
+
+# Ways load_features() can read the input (see there)
+READERS = ("auto", "pyogrio", "stream", "geopandas")
+
+# Pixels to which label anchors are placed
+LABEL_PRECISION = 0.5
+
+# Coordinates are rounded to a grid of 2^GRID_BITS units across the
+# longer side of the canvas
+GRID_BITS = 14
+
+# Coarser copies of the regions kept for drawing the map zoomed out:
+# copy k is simplified LOD_FACTOR^k times as coarsely as the full
+# geometry, and kept only if it saves a quarter of the vertices of the
+# previous one
+LOD_LEVELS = 3
+LOD_FACTOR = 4
+LOD_MIN_SAVING = 0.75
+
+# Orders the importer can give regions: as in the dataset, or along a
+# Hilbert curve of their centroids (see utils/region_order.py)
+REGION_ORDERS = ("dataset", "hilbert")
+
+# Regions the importer projects and hands on at a time (per worker)
+REGION_CHUNK = 64
+
+# Properties that may hold the country and the region name
+COUNTRY_FIELDS = ["admin", "ADMIN", "country", "COUNTRY", "Admin", "Country"]
+NAME_FIELDS = [
+    "NAME",
+    "name",
+    "Name",
+    "NAME_1",
+    "NAME_2",
+    "ADMIN",
+    "admin",
+    "STATE_NAME",
+    "PROVINCE",
+    "REGION",
+    "region",
+    "State",
+    "Province",
+]
+
+
+def read_columns(path, columns, where=None):
+    """
+    Read some property columns and the geometry of a vector file with
+    pyogrio.
+
+    GDAL reads the file in C and hands the geometry over as a WKB array,
+    through Arrow when pyarrow is installed, so no per-feature Python
+    objects are built; columns missing from the file are skipped. With
+    an OGR SQL where clause, only the features it matches are kept.
+    """
+    return pyogrio.read_dataframe(
+        path, columns=columns, where=where, use_arrow=pyarrow is not None)
+
+
+def _sql_literal(value):
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(value)
+
+
+def _where_clause(filter_field, filter_values):
+    """
+    The field filter of load_features() as an OGR SQL where clause, so
+    GDAL drops the other features while reading, or None without it.
+    """
+    if not (filter_field and filter_values):
+        return None
+    values = ", ".join(map(_sql_literal, filter_values))
+    return f'"{filter_field}" IN ({values})'
+
+
+def load_features(
+    geojson_path, filter_country=None, filter_field=None, filter_values=None,
+    reader="auto",
+):
+    """
+    Read the features to import, applying the filters.
+
+    With pyogrio installed, only the columns the importer uses are read
+    (see read_columns()), and GDAL drops the features the field filter
+    rejects; the country filter, whose field depends on the file, runs
+    after (finding it would take GDAL another pass over the file).
+    Otherwise GeoJSON files are streamed (see utils/geojson_stream.py):
+    the filters run on each feature's properties as it is read, and only
+    the kept features, with the properties the importer uses, are
+    materialised. Other formats are read whole with geopandas and
+    filtered after.
+
+    Args:
+        geojson_path: Path to GeoJSON (or other vector) file
+        filter_country: Country name to filter (optional)
+        filter_field: Field name to filter on (optional)
+        filter_values: List of values to include (optional)
+        reader: One of READERS; "auto" picks pyogrio when it is
+            installed, then the streaming reader for GeoJSON, then
+            geopandas
+    """
+    if reader == "auto":
+        if pyogrio is not None:
+            reader = "pyogrio"
+        elif geojson_path.lower().endswith(GEOJSON_EXTENSIONS):
+            reader = "stream"
+        else:
+            reader = "geopandas"
+    if reader not in READERS:
+        raise ValueError(f"Unknown reader: {reader}")
+
+    if reader == "stream":
+
+        def keep(properties):
+            if filter_country:
+                for field in COUNTRY_FIELDS:
+                    if field in properties:
+                        if properties[field] != filter_country:
+                            return False
+                        break
+            if filter_field and filter_values:
+                if properties.get(filter_field) not in filter_values:
+                    return False
+            return True
+
+        columns = NAME_FIELDS + COUNTRY_FIELDS
+        if filter_field:
+            columns.append(filter_field)
+        gdf = read_geojson(geojson_path, keep, columns)
+        if filter_country or (filter_field and filter_values):
+            print(f"Filtered while reading: {len(gdf)} features")
+        return gdf
+
+    if reader == "pyogrio":
+        columns = NAME_FIELDS + COUNTRY_FIELDS
+        if filter_field:
+            columns.append(filter_field)
+        where = _where_clause(filter_field, filter_values)
+        try:
+            gdf = read_columns(geojson_path, columns, where)
+        except ValueError:
+            if where is None:
+                raise
+            # GDAL rejects a where clause naming a missing field
+            gdf = read_columns(geojson_path, columns)
+    else:
+        gdf = gpd.read_file(geojson_path)
+
+    # Apply filters if specified
+    if filter_country:
+        for field in COUNTRY_FIELDS:
+            if field in gdf.columns:
+                gdf = gdf[gdf[field] == filter_country]
+                print(
+                    f"Filtered by {field} == {filter_country}: {
+                        len(gdf)} features")
+                break
+
+    if filter_field and filter_values:
+        if filter_field in gdf.columns:
+            gdf = gdf[gdf[filter_field].isin(filter_values)]
+            print(f"Filtered by {filter_field}: {len(gdf)} features")
+
+    return gdf
+
+
+def generate_regions_from_geojson(geojson_path, **options):
+    """
+    Generate region data from any GeoJSON file, as a list of region
+    dicts (see iter_regions_from_geojson() for the options).
+    """
+    return list(iter_regions_from_geojson(geojson_path, **options))
+
+
+def iter_regions_from_geojson(
     geojson_path,
     output_name="regions",
     screen_width=800,
@@ -30,9 +251,30 @@ def generate_regions_from_geojson(
     filter_values=None,
     special_regions=None,
     special_region_config=None,
+    jobs=1,
+    shared_borders=True,
+    max_gap_area=1.0,
+    max_points=50,
+    total_points=None,
+    min_part_area=None,
+    min_border_length=1.0,
+    region_order="dataset",
+    grid_bits=GRID_BITS,
+    lod_levels=LOD_LEVELS,
+    reader="auto",
+    profile=None,
+    cache=None,
+    executor=None,
 ):
     """
-    Generate region data from any GeoJSON file.
+    Generate region data from any GeoJSON file, one region at a time.
+
+    The stages that need the whole map (simplifying shared borders,
+    finding neighbours, the region order) run on geometries first; the
+    region dicts, with their points, detail levels and labels, are then
+    built a chunk at a time and yielded in order, so a consumer that
+    writes them out (see write_regions_as_region_stream()) never holds
+    them all.
 
     Args:
         geojson_path: Path to GeoJSON file
@@ -46,31 +288,319 @@ def generate_regions_from_geojson(
         filter_values: List of values to include (optional)
         special_regions: List of region names to handle specially (like Alaska/Hawaii)
         special_region_config: Dict with config for special regions {name: {scale: float, position: (x, y)}}
+        jobs: Number of worker processes for repair, simplification,
+            projection and the neighbour tests (output does not depend
+            on it); with shared_borders, each detail level is simplified
+            in one process, so at most lod_levels run at once
+        shared_borders: Simplify shared borders once for both neighbours
+            (see utils/topology.py) instead of each polygon on its own
+        max_gap_area: Report gaps between regions larger than this many
+            square pixels after simplification
+        max_points: Vertex budget per region part (insets use at most 30)
+        total_points: Vertex budget for the whole map, counting shared
+            border vertices once (optional); it can be overrun, with a
+            warning (see simplify_shared_borders())
+        min_part_area: Drop the parts of multipart regions (islands,
+            exclaves) smaller than this many square pixels; the largest
+            part is always kept (default: keep every part)
+        min_border_length: Regions are neighbours when they share more
+            than this many pixels of border; corner-only contacts and
+            near misses do not count. Each region's 'border_lengths'
+            gives the length shared with each neighbour, in whole pixels
+            rounded up
+        region_order: "dataset" keeps the input order; "hilbert" sorts
+            regions along a Hilbert curve of their centroids so nearby
+            regions get nearby ids (neighbour ids are remapped)
+        grid_bits: Round coordinates to a grid of 2^grid_bits units
+            across the longer side of the screen (see grid_scale()), so
+            maps stay sharp when zoomed in; 0 truncates them to whole
+            pixels
+        lod_levels: Detail levels per region, the full geometry
+            included: regions get up to lod_levels - 1 coarser copies
+            as 'lods' (see _region_lods()), which the game draws
+            instead when their error is below a pixel on screen
+        reader: How to read the input (see load_features())
+        profile: Optional StageProfile (utils/profiling.py) that gets a
+            lap per import stage: read (with the filters), reproject,
+            repair (see repair_geometries()), simplify, insets,
+            neighbors, reorder when regions are reordered, regions
+            (projection, detail levels and labels, along with whatever
+            the consumer does with each region) and gaps
+        cache: Optional StageCache (utils/import_cache.py) keeping the
+            results of the stages that do not depend on the layout
+            (reading and reprojecting, simplifying and finding
+            neighbours), so changing only scale_factor or the insets'
+            placement re-runs just the transform and what follows
+        executor: Process pool for the parallel stages; with jobs > 1
+            and none given, one is started for the whole import
     """
-    # Load GeoJSON
-    gdf = gpd.read_file(geojson_path)
+    if executor is None and jobs > 1:
+        arguments = dict(locals())
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            arguments["executor"] = executor
+            yield from iter_regions_from_geojson(**arguments)
+        return
+    if region_order not in REGION_ORDERS:
+        raise ValueError(f"Unknown region order: {region_order}")
+    if profile is None:
+        profile = StageProfile()
 
-    # Apply filters if specified
-    if filter_country:
-        country_fields = [
-            "admin",
-            "ADMIN",
-            "country",
-            "COUNTRY",
-            "Admin",
-            "Country"]
-        for field in country_fields:
-            if field in gdf.columns:
-                gdf = gdf[gdf[field] == filter_country]
-                print(
-                    f"Filtered by {field} == {filter_country}: {
-                        len(gdf)} features")
-                break
+    # Reading, reprojecting, simplifying and finding neighbours do not
+    # depend on the layout, so they can come from the stage cache
+    source_params = {
+        "filter_country": filter_country,
+        "filter_field": filter_field,
+        "filter_values": filter_values,
+        "special_regions": special_regions,
+    }
+    (main_names, main_geoms, special_features), cached = _cached(
+        cache, "source", source_params,
+        partial(_read_source, geojson_path, reader=reader, profile=profile,
+                jobs=jobs, executor=executor, **source_params))
+    if cached:
+        profile.lap("read", features=len(main_geoms), cached=True)
 
-    if filter_field and filter_values:
-        if filter_field in gdf.columns:
-            gdf = gdf[gdf[filter_field].isin(filter_values)]
-            print(f"Filtered by {filter_field}: {len(gdf)} features")
+    # Process main regions
+    minx, miny, maxx, maxy = shapely.total_bounds(main_geoms)
+
+    # Calculate scale
+    width = maxx - minx
+    height = maxy - miny
+
+    # Calculate appropriate scale
+    scale_x = (screen_width * 0.8) / width
+    scale_y = (screen_height * 0.7) / height
+    scale = min(scale_x, scale_y) * scale_factor
+
+    # Center the map
+    map_width = width * scale
+    map_height = height * scale
+    center_x_offset = (screen_width - map_width) / 2
+    center_y_offset = (screen_height - map_height) / 2
+
+    # Auto-calculate simplification tolerance if not provided
+    if simplification_tolerance is None:
+        # Base it on the size of the region
+        avg_area = np.nanmean(shapely.area(main_geoms))
+        simplification_tolerance = avg_area**0.5 / 100
+
+    # Process main regions, with all their parts
+    if min_part_area:
+        min_area = min_part_area / scale**2
+    else:
+        min_area = 0
+    main_parts = [_polygon_parts(geom, min_area) for geom in main_geoms]
+    # Skip non-polygon geometries
+    kept_names = [name for name, parts in zip(main_names, main_parts)
+                  if parts]
+    kept_geoms = [geom for geom, parts in zip(main_geoms, main_parts)
+                  if parts]
+    kept = [parts for parts in main_parts if parts]
+    # The full geometry, then the coarser copies
+    tolerances = [simplification_tolerance * LOD_FACTOR**level
+                  for level in range(lod_levels)]
+    if shared_borders:
+        simplify_params = {
+            **source_params,
+            "min_area": min_area,
+            "tolerances": tolerances,
+            "max_points": max_points,
+            "total_points": total_points,
+        }
+        simplified, cached = _cached(
+            cache, "simplify", simplify_params,
+            partial(map_chunks,
+                    partial(_simplify_levels, kept=kept,
+                            max_points=max_points,
+                            total_points=total_points),
+                    tolerances, jobs, executor))
+        tolerances = [None] * lod_levels
+        budget = None
+    else:
+        simplified = [kept] * lod_levels
+        cached = False
+        budget = max_points
+    profile.lap("simplify", features=len(kept),
+                vertices=_polygon_vertices(simplified[0]), cached=cached)
+    resolution = grid_scale(screen_width, screen_height, grid_bits)
+    project = partial(
+        _project_polygons,
+        scale=scale,
+        offset=(center_x_offset, center_y_offset),
+        origin=(minx, maxy),
+        resolution=resolution,
+    )
+
+    def project_main(level, positions):
+        """The projected parts of some main regions at a detail level"""
+        return map_chunks(
+            partial(project, tolerance=tolerances[level], max_points=budget),
+            [simplified[level][k] for k in positions],
+            jobs,
+            executor,
+        )
+
+    # Process special regions
+    if special_region_config is None:
+        special_region_config = {}
+        # Default positioning for special regions
+        y_offset = screen_height - 200
+        x_offset = 50
+        for i, special in enumerate(special_regions or []):
+            special_region_config[special] = {
+                "scale": 0.3,
+                "position": (x_offset + i * 150, y_offset),
+            }
+
+    # (name, geometry, projected parts, coarser copies) of each inset
+    insets = []
+    for special_name, special_geoms in special_features.items():
+        config = special_region_config.get(
+            special_name, {"scale": 0.3, "position": (50, screen_height - 200)}
+        )
+        special_scale = scale * config["scale"]
+        pos_x, pos_y = config["position"]
+
+        # Only a handful of features, so these stay in this process.
+        # Each one is placed by its own bounds.
+        if min_part_area:
+            min_area = min_part_area / special_scale**2
+        else:
+            min_area = 0
+        project_inset = partial(
+            _project_polygons,
+            [_polygon_parts(geom, min_area) for geom in special_geoms],
+            scale=special_scale,
+            offset=(pos_x, pos_y),
+            origin=None,
+            max_points=min(max_points, 30),
+            resolution=resolution,
+        )
+        inset_tolerance = simplification_tolerance * 2
+        projected = project_inset(tolerance=inset_tolerance)
+        coarser = [
+            project_inset(tolerance=inset_tolerance * LOD_FACTOR**level)
+            for level in range(1, lod_levels)]
+        for k, (geom, parts) in enumerate(zip(special_geoms, projected)):
+            if parts is not None:
+                insets.append((special_name, geom, parts,
+                               [copies[k] for copies in coarser]))
+    profile.lap("insets", features=len(insets))
+
+    # Determine neighbors by shared border length, in screen pixels.
+    # This only needs the geometries, so it runs before any region is
+    # built and the regions can then be made one at a time.
+    print("Calculating neighbors...")
+    # Every shared border is cached, so the minimum length (in map
+    # units, so it depends on the scale) is applied after
+    (neighbors, lengths), cached = _cached(
+        cache, "neighbors",
+        {**source_params, "tolerance": simplification_tolerance},
+        partial(find_neighbors,
+                kept_geoms + [geom for _, geom, _, _ in insets],
+                simplification_tolerance, 0.0, jobs, executor))
+    min_length = min_border_length / scale
+    shared_borders_of = [
+        [(neighbor, length) for neighbor, length
+         in zip(region_neighbors, region_lengths) if length > min_length]
+        for region_neighbors, region_lengths in zip(neighbors, lengths)]
+    count = len(kept) + len(insets)
+    chunk = REGION_CHUNK * max(jobs, 1)
+    profile.lap("neighbors", features=count,
+                borders=sum(map(len, shared_borders_of)) // 2,
+                cached=cached)
+
+    order = list(range(count))
+    if region_order == "hilbert":
+        # Centroids of the projected regions, a chunk at a time
+        centroids = []
+        for first in range(0, len(kept), chunk):
+            centroids.extend(region_centroids(
+                [_region_shape(parts) for parts in project_main(
+                    0, range(first, min(first + chunk, len(kept))))]))
+        centroids.extend(region_centroids(
+            [_region_shape(parts) for _, _, parts, _ in insets]))
+        order = centroid_order(centroids)
+        profile.lap("reorder", features=count)
+    new_ids = {position: new_id for new_id, position in enumerate(order)}
+
+    # Build and yield the regions a chunk at a time, so only one chunk's
+    # points are held in Python lists
+    shapes = [None] * len(kept)
+    vertices = lod_vertices = 0
+    for first in range(0, count, chunk):
+        positions = order[first:first + chunk]
+        main = [position for position in positions
+                if position < len(kept)]
+        levels = [project_main(level, main) for level in range(lod_levels)]
+        made = {}
+        for k, position in enumerate(main):
+            made[position] = (kept_names[position], levels[0][k],
+                              [copies[k] for copies in levels[1:]])
+        for new_id, position in enumerate(positions, first):
+            if position in made:
+                name, parts, copies = made[position]
+            else:
+                name, _, parts, copies = insets[position - len(kept)]
+            region = _region_record(new_id, name, parts)
+            lods = _region_lods(parts, copies)
+            if lods:
+                region["lods"] = lods
+            pairs = sorted((new_ids[neighbor], math.ceil(length * scale))
+                           for neighbor, length in shared_borders_of[position])
+            region["neighbors"] = [neighbor for neighbor, _ in pairs]
+            region["border_lengths"] = [length for _, length in pairs]
+            if position in made:
+                shapes[position] = [
+                    Polygon(ring, holes) for ring, holes
+                    in zip(region_parts(region), region_holes(region))]
+            vertices += _region_vertices([region])
+            lod_vertices += _lod_vertices([region])
+            yield region
+    profile.lap("regions", features=count, vertices=vertices,
+                lod_vertices=lod_vertices)
+
+    # Check that simplification did not open gaps between neighbours
+    gaps = find_border_gaps(
+        _to_screen([part for parts in kept for part in parts], scale,
+                   (center_x_offset, center_y_offset), (minx, maxy)),
+        [polygon for polygons in shapes for polygon in polygons],
+        max_gap_area,
+    )
+    if gaps:
+        print(
+            f"Warning: {len(gaps)} gaps between regions larger than "
+            f"{max_gap_area} px² (largest {gaps[0].area:.1f} px²)")
+    profile.lap("gaps", gaps=len(gaps))
+
+
+def _cached(cache, stage, params, compute):
+    """
+    compute() or, with a StageCache, its cached result; returns
+    (result, whether it was cached)
+    """
+    if cache is None:
+        return compute(), False
+    return cache.get(stage, params, compute)
+
+
+def _read_source(geojson_path, filter_country=None, filter_field=None,
+                 filter_values=None, special_regions=None, reader="auto",
+                 profile=None, jobs=1, executor=None):
+    """
+    Read, filter, reproject and repair the features to import.
+
+    Returns (main_names, main_geoms, special_geoms): the names and
+    geometries of the main regions, in input order, and the geometries
+    of each of the special_regions found, by name.
+    """
+    if profile is None:
+        profile = StageProfile()
+
+    # Load GeoJSON, applying the filters while reading
+    gdf = load_features(
+        geojson_path, filter_country, filter_field, filter_values, reader)
+    profile.lap("read", features=len(gdf))
 
     # Try to reproject to a suitable CRS
     original_crs = gdf.crs
@@ -97,25 +627,24 @@ def generate_regions_from_geojson(
                 gdf = gdf.to_crs(epsg=3857)  # Web Mercator as fallback
         except Exception:
             print("Warning: Could not reproject, using original CRS")
+    profile.lap("reproject", features=len(gdf))
+
+    # Repair invalid polygons before anything measures them
+    geometries, repaired, failed = repair_geometries(
+        gdf.geometry.to_numpy(), jobs, executor)
+    if failed:
+        print(f"Warning: {failed} invalid features could not be repaired")
+    if repaired:
+        print(f"Repaired {repaired} invalid features")
+    if repaired or failed:
+        gdf = gdf.set_geometry(
+            gpd.GeoSeries(geometries, index=gdf.index, crs=gdf.crs))
+    profile.lap("repair", features=len(gdf), repaired=repaired,
+                failed=failed)
 
     # Identify name field
-    name_fields = [
-        "NAME",
-        "name",
-        "Name",
-        "NAME_1",
-        "NAME_2",
-        "ADMIN",
-        "admin",
-        "STATE_NAME",
-        "PROVINCE",
-        "REGION",
-        "region",
-        "State",
-        "Province",
-    ]
     name_field = None
-    for field in name_fields:
+    for field in NAME_FIELDS:
         if field in gdf.columns:
             name_field = field
             break
@@ -131,152 +660,477 @@ def generate_regions_from_geojson(
                 special_gdfs[special] = special_gdf
                 main_gdf = main_gdf[main_gdf[name_field] != special]
 
-    # Process main regions
-    minx, miny, maxx, maxy = main_gdf.total_bounds
+    if name_field:
+        main_names = [str(value) for value in main_gdf[name_field]]
+    else:
+        main_names = [f"Region {idx}" for idx in main_gdf.index]
+    special_geoms = {name: list(special_gdf.geometry)
+                     for name, special_gdf in special_gdfs.items()}
+    return main_names, list(main_gdf.geometry), special_geoms
 
-    # Calculate scale
-    width = maxx - minx
-    height = maxy - miny
 
-    # Calculate appropriate scale
-    scale_x = (screen_width * 0.8) / width
-    scale_y = (screen_height * 0.7) / height
-    scale = min(scale_x, scale_y) * scale_factor
+def _repair_chunk(geometries):
+    """
+    (geometry, status) for each geometry: the valid ones unchanged, the
+    others repaired or, if they cannot be, unchanged and "failed".
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    status = np.full(len(geometries), "valid", dtype=object)
+    invalid = np.flatnonzero(
+        ~shapely.is_valid(geometries) & ~shapely.is_missing(geometries))
+    if len(invalid):
+        status[invalid] = "repaired"
+        try:
+            fixed = list(shapely.make_valid(geometries[invalid]))
+        except GEOSException:
+            fixed = [None] * len(invalid)
+        for k, position in enumerate(invalid.tolist()):
+            polygons = _polygonal(fixed[k])
+            if polygons is None:
+                # Fall back to buffer(0), which may fix what make_valid
+                # could not (or reduce it to its lines)
+                try:
+                    polygons = _polygonal(
+                        shapely.buffer(geometries[position], 0))
+                except GEOSException:
+                    polygons = None
+            if polygons is None:
+                status[position] = "failed"
+            else:
+                geometries[position] = polygons
+    return list(zip(geometries.tolist(), status.tolist()))
 
-    # Center the map
-    map_width = width * scale
-    map_height = height * scale
-    center_x_offset = (screen_width - map_width) / 2
-    center_y_offset = (screen_height - map_height) / 2
 
-    # Auto-calculate simplification tolerance if not provided
-    if simplification_tolerance is None:
-        # Base it on the size of the region
-        avg_area = main_gdf.geometry.area.mean()
-        simplification_tolerance = avg_area**0.5 / 100
+def _polygonal(geom):
+    """
+    The polygonal part of a valid geometry, as a Polygon or a
+    MultiPolygon, or None if it has none.
+    """
+    if geom is None or geom.is_empty or not geom.is_valid:
+        return None
+    if geom.geom_type in ("Polygon", "MultiPolygon"):
+        return geom
+    polygons = [part for part in shapely.get_parts(geom)
+                if part.geom_type in ("Polygon", "MultiPolygon")]
+    polygons = [polygon for part in polygons
+                for polygon in getattr(part, "geoms", [part])]
+    if not polygons:
+        return None
+    if len(polygons) == 1:
+        return polygons[0]
+    return MultiPolygon(polygons)
 
-    regions = []
 
-    # Process main regions
-    for idx, row in main_gdf.iterrows():
-        geom = row.geometry
+def repair_geometries(geometries, jobs=1, executor=None):
+    """
+    Make invalid polygons valid, so the neighbour search and the
+    simplification do not trip over them.
+
+    Each invalid geometry goes through shapely's make_valid(), keeping
+    only its polygons (a self-intersecting ring can leave stray lines
+    and points behind), and through buffer(0) if that leaves none.
+    Geometries neither can repair are kept as they are. The checks run
+    in jobs chunks, in executor if given (see map_chunks()).
+
+    Returns:
+        (geometries, repaired, failed): the geometries in input order,
+        and how many were repaired and how many could not be
+    """
+    results = map_chunks(_repair_chunk, list(geometries), jobs, executor)
+    statuses = [status for _, status in results]
+    return ([geom for geom, _ in results], statuses.count("repaired"),
+            statuses.count("failed"))
+
+
+def _simplify_levels(tolerances, kept, max_points, total_points):
+    """
+    simplify_shared_borders() of kept at each of the tolerances; the
+    detail levels are independent, so map_chunks() runs them in
+    parallel
+    """
+    return [simplify_shared_borders(kept, tolerance, max_points,
+                                    total_points)
+            for tolerance in tolerances]
 
-        # Handle MultiPolygon by taking the largest polygon
-        if geom.geom_type == "MultiPolygon":
-            geom = max(geom.geoms, key=lambda g: g.area)
-        elif geom.geom_type != "Polygon":
-            continue  # Skip non-polygon geometries
 
+def _polygon_vertices(regions):
+    """Vertices of lists of Polygons, the parts of each region"""
+    return int(shapely.get_num_coordinates(np.asarray(
+        [part for parts in regions for part in parts], dtype=object)).sum())
+
+
+def _region_vertices(regions):
+    """Vertices of region dicts, holes included"""
+    return sum(len(ring)
+               for region in regions
+               for part, holes in zip(region_parts(region),
+                                      region_holes(region))
+               for ring in [part, *holes])
+
+
+def _lod_vertices(regions):
+    """Vertices of the 'lods' of region dicts, holes included"""
+    return _region_vertices(
+        [lod for region in regions for lod in region.get("lods", ())])
+
+
+def _outline(parts):
+    """All the rings of projected parts as one MultiLineString"""
+    return MultiLineString(
+        [ring for rings in parts for ring in rings if len(ring) >= 2])
+
+
+def _region_lods(parts, coarser):
+    """
+    The 'lods' of a region: those of its coarser copies (finest first,
+    as projected by _project_polygons()) that have at most
+    LOD_MIN_SAVING of the vertices of the previous detail level. Each
+    is a dict of 'parts', 'holes' when it has any, and 'error': the
+    Hausdorff distance between its rings and the full parts' rings, in
+    pixels rounded up to a hundredth.
+    """
+    full = _outline(parts)
+    vertices = sum(len(ring) for rings in parts for ring in rings)
+    lods = []
+    for lod_parts in coarser:
+        if lod_parts is None:
+            continue
+        count = sum(len(ring) for rings in lod_parts for ring in rings)
+        outline = _outline(lod_parts)
+        if count > vertices * LOD_MIN_SAVING or outline.is_empty:
+            continue
+        error = shapely.hausdorff_distance(full, outline)
+        lod = {
+            "error": math.ceil(error * 100) / 100,
+            "parts": [rings[0] for rings in lod_parts],
+        }
+        if any(len(rings) > 1 for rings in lod_parts):
+            lod["holes"] = [rings[1:] for rings in lod_parts]
+        lods.append(lod)
+        vertices = count
+    return lods
+
+
+def _polygon_parts(geom, min_area=0):
+    """
+    The polygons of a geometry, largest first, or [] if it has none.
+
+    Parts smaller than min_area are dropped, except the largest one.
+    """
+    if geom.geom_type == "MultiPolygon":
+        parts = sorted(geom.geoms, key=lambda g: g.area, reverse=True)
+        return parts[:1] + [part for part in parts[1:]
+                            if part.area >= min_area]
+    if geom.geom_type == "Polygon":
+        return [geom]
+    return []
+
+
+def _region_shape(parts):
+    """
+    The geometry keys of a region dict from its projected parts: its
+    'points', and 'parts' when it has several and 'holes' when it has
+    any.
+    """
+    region = {"points": parts[0][0]}
+    if len(parts) > 1:
+        region["parts"] = [rings[0] for rings in parts]
+    if any(len(rings) > 1 for rings in parts):
+        region["holes"] = [rings[1:] for rings in parts]
+    return region
+
+
+def _region_record(region_id, name, parts):
+    """A region dict from its projected parts, with its label placement"""
+    region = {"id": region_id, "name": name, **_region_shape(parts)}
+    region.update(_label_placement(parts[0][0], parts[0][1:]))
+    return region
+
+
+def _label_placement(points, holes):
+    """
+    The 'label' anchor of a region's main part, its pole of
+    inaccessibility (the interior point farthest from the outline, found
+    to LABEL_PRECISION pixels), and the 'label_width' that fits there.
+    """
+    if len(set(points)) < 3:
+        return {}
+    try:
+        pole = polylabel(Polygon(points, holes), LABEL_PRECISION)
+        anchor = (round(pole.x, 1), round(pole.y, 1))
+    except (GEOSException, ValueError):
+        anchor = label_anchor(points, holes)
+    width = label_width(points, holes, anchor)
+    return {"label": anchor, "label_width": math.floor(width * 10) / 10}
+
+
+def _to_screen(geometries, scale, offset, origin):
+    """Apply the screen transform to geometries, without rounding"""
+    minx, maxy = origin
+
+    def transform(coords):
+        return np.column_stack((
+            (coords[:, 0] - minx) * scale + offset[0],
+            (maxy - coords[:, 1]) * scale + offset[1],
+        ))
+
+    return shapely.transform(np.asarray(geometries, dtype=object),
+                             transform)
+
+
+def grid_scale(screen_width, screen_height, grid_bits):
+    """
+    Grid units per pixel for 2^grid_bits units across the longer side
+    of the screen, or None for whole pixels (grid_bits 0).
+    """
+    if not grid_bits:
+        return None
+    return 2 ** grid_bits / max(screen_width, screen_height)
+
+
+def _project_polygons(regions, tolerance, scale, offset, origin,
+                      max_points, resolution=None):
+    """
+    Simplify region polygons and convert them to screen coordinates.
+
+    Each result is a list of parts, one per polygon whose exterior
+    still has three distinct points, or None for a region without
+    parts. A part is a list of rings, its exterior followed by the holes
+    that still have three distinct points, each a list of (x, y) points
+    with at most max_points entries (no limit when None).
+    Simplification and the transform run on all the rings' coordinates
+    at once.
+
+    Args:
+        regions: Lists of Polygons, the parts of each region
+        tolerance: Simplification tolerance, or None if the geometries
+            are already simplified
+        origin: (min_x, max_y) of the projected area, or None to place
+            each region by its own simplified bounds
+        resolution: Round coordinates to this many grid units per pixel
+            (see grid_scale()), or None to truncate them to integers
+    """
+    results = [None] * len(regions)
+    polygons = []
+    owners = []
+    for position, parts in enumerate(regions):
+        polygons.extend(parts)
+        owners.extend([position] * len(parts))
+    if not polygons:
+        return results
+
+    polygons = np.asarray(polygons, dtype=object)
+    owners = np.asarray(owners)
+    if tolerance is not None:
         # Simplify geometry
-        geom = geom.simplify(tolerance=simplification_tolerance)
-
-        # Convert coordinates
-        coords = []
-        for x, y in geom.exterior.coords:
-            screen_x = int((x - minx) * scale + center_x_offset)
-            screen_y = int((maxy - y) * scale + center_y_offset)
-            coords.append((screen_x, screen_y))
-
-        # Limit points if needed
-        if len(coords) > 50:
-            step = len(coords) // 50
-            coords = coords[::step]
-
-        # Get region name
-        if name_field:
-            name = str(row[name_field])
-        else:
-            name = f"Region {idx}"
-
-        regions.append(
-            {
-                "id": len(regions),
-                "name": name,
-                "points": coords,
-                "geometry": geom,
-                "original_geom": row.geometry,
-            }
-        )
+        polygons = shapely.simplify(polygons, tolerance)
+    # Exteriors come before the holes of the same polygon
+    rings, polygon_index = shapely.get_rings(polygons, return_index=True)
+    coords, ring_index = shapely.get_coordinates(rings, return_index=True)
 
-    # Process special regions
-    if special_region_config is None:
-        special_region_config = {}
-        # Default positioning for special regions
-        y_offset = screen_height - 200
-        x_offset = 50
-        for i, special in enumerate(special_regions or []):
-            special_region_config[special] = {
-                "scale": 0.3,
-                "position": (x_offset + i * 150, y_offset),
-            }
+    if origin is None:
+        bounds = shapely.bounds(polygons)
+        region_minx = np.full(len(regions), np.inf)
+        region_maxy = np.full(len(regions), -np.inf)
+        np.minimum.at(region_minx, owners, bounds[:, 0])
+        np.maximum.at(region_maxy, owners, bounds[:, 3])
+        coord_owners = owners[polygon_index[ring_index]]
+        minx = region_minx[coord_owners]
+        maxy = region_maxy[coord_owners]
+    else:
+        minx, maxy = origin
 
-    for special_name, special_gdf in special_gdfs.items():
-        config = special_region_config.get(
-            special_name, {"scale": 0.3, "position": (50, screen_height - 200)}
-        )
-        special_scale = scale * config["scale"]
-        pos_x, pos_y = config["position"]
+    screen_x = (coords[:, 0] - minx) * scale + offset[0]
+    screen_y = (maxy - coords[:, 1]) * scale + offset[1]
+    if resolution is None:
+        # Whole pixels (astype truncates like int())
+        screen_x = screen_x.astype(np.int64)
+        screen_y = screen_y.astype(np.int64)
+    else:
+        screen_x = np.round(screen_x * resolution) / resolution
+        screen_y = np.round(screen_y * resolution) / resolution
 
-        for idx, row in special_gdf.iterrows():
-            geom = row.geometry
-            if geom.geom_type == "MultiPolygon":
-                geom = max(geom.geoms, key=lambda g: g.area)
-            elif geom.geom_type != "Polygon":
-                continue
-
-            geom = geom.simplify(tolerance=simplification_tolerance * 2)
-
-            # Get bounds for this specific region
-            spec_minx, spec_miny, spec_maxx, spec_maxy = geom.bounds
-
-            coords = []
-            for x, y in geom.exterior.coords:
-                screen_x = int((x - spec_minx) * special_scale + pos_x)
-                screen_y = int((spec_maxy - y) * special_scale + pos_y)
-                coords.append((screen_x, screen_y))
-
-            if len(coords) > 30:
-                step = len(coords) // 30
-                coords = coords[::step]
-
-            regions.append(
-                {
-                    "id": len(regions),
-                    "name": special_name,
-                    "points": coords,
-                    "geometry": geom,
-                    "original_geom": row.geometry,
-                }
-            )
-
-    # Determine neighbors
-    print("Calculating neighbors...")
-    for i, region in enumerate(regions):
-        region["neighbors"] = []
-        for j, other in enumerate(regions):
-            if i != j:
-                try:
-                    # Check if geometries touch or are very close
-                    if (
-                        region["original_geom"].touches(other["original_geom"]) or
-                        region["original_geom"].distance(
-                            other["original_geom"]) < simplification_tolerance * 10
-                    ):
-                        region["neighbors"].append(j)
-                except Exception:
-                    pass  # Skip if geometry operation fails
-
-    # Clean up - remove geometry objects
-    for region in regions:
-        del region["geometry"]
-        del region["original_geom"]
+    def screen_ring(start, end):
+        ring_x = screen_x[start:end]
+        ring_y = screen_y[start:end]
+
+        # Limit points if needed, by Visvalingam-Whyatt effective area
+        if max_points is not None and len(ring_x) > max_points:
+            keep = reduce_ring(coords[start:end].tolist(), max_points)
+            ring_x = ring_x[keep]
+            ring_y = ring_y[keep]
+        return list(zip(ring_x.tolist(), ring_y.tolist()))
+
+    ring_ends = np.searchsorted(
+        ring_index, np.arange(len(rings)), "right").tolist()
+    polygon_ends = np.searchsorted(
+        polygon_index, np.arange(len(polygons)), "right").tolist()
+    ring_id = 0
+    for position, polygon_end in zip(owners.tolist(), polygon_ends):
+        part = []
+        for ring_id in range(ring_id, polygon_end):
+            start = ring_ends[ring_id - 1] if ring_id else 0
+            ring = screen_ring(start, ring_ends[ring_id])
+            if not part or len(set(ring)) >= 3:
+                part.append(ring)
+        ring_id = polygon_end
+        if not part:
+            part = [[]]  # Emptied by simplification
 
-    return regions
+        parts = results[position]
+        if parts is None:
+            results[position] = [part]
+        elif len(set(part[0])) >= 3:
+            parts.append(part)
+    return results
+
+
+def _border_lengths(pairs, tolerance):
+    """
+    Length of the border shared by each pair of geometries.
+
+    Each pair is (boundary, boundary, box), both boundaries clipped to
+    box (their bounding boxes' overlap, grown by tolerance) before they
+    are compared. The length is the mean of the lengths of each boundary
+    within tolerance of the other, less the 2 * tolerance every stretch
+    gains at its two ends, so a corner-only contact comes out as 0.
+    """
+    columns = np.empty((2, len(pairs)), dtype=object)
+    boxes = np.empty((len(pairs), 4))
+    for k, (a_line, b_line, box) in enumerate(pairs):
+        columns[:, k] = (a_line, b_line)
+        boxes[k] = box
+
+    def clip(lines, boxes):
+        clipped = np.empty(len(boxes), dtype=object)
+        clipped[:] = [shapely.clip_by_rect(line, *box)
+                      for line, box in zip(lines, boxes.tolist())]
+        return clipped
+
+    def shared(a_line, b_line, boxes):
+        a_line = clip(a_line, boxes)
+        b_line = clip(b_line, boxes)
+        if tolerance <= 0:
+            return shapely.length(shapely.intersection(a_line, b_line))
+        a_zone = shapely.buffer(a_line, tolerance)
+        b_zone = shapely.buffer(b_line, tolerance)
+        a_length = shapely.length(shapely.intersection(a_line, b_zone))
+        b_length = shapely.length(shapely.intersection(b_line, a_zone))
+        return np.maximum((a_length + b_length) / 2 - 2 * tolerance, 0)
+
+    try:
+        return shared(*columns, boxes).tolist()
+    except GEOSException:
+        # Fall back to measuring pair by pair, counting the pairs whose
+        # geometry operation fails as not adjacent
+        lengths = []
+        for a_line, b_line, box in pairs:
+            try:
+                lengths.append(float(shared(
+                    [a_line], [b_line], np.asarray([box]))[0]))
+            except GEOSException:
+                lengths.append(0.0)
+        return lengths
+
+
+def find_neighbors(geometries, tolerance, min_length=0.0, jobs=1,
+                   executor=None):
+    """
+    Find neighbouring geometries by the length of their shared border.
+
+    Boundaries that run within tolerance of each other count as shared,
+    which absorbs small mismatches between the inputs' borders; regions
+    that only meet at a corner, or only come close, share no length.
+    Candidates come from an STRtree query with every envelope grown by
+    tolerance, so only nearby pairs are measured, each pair once and
+    only where their bounding boxes overlap, and the result is mirrored.
+
+    Args:
+        geometries: List of shapely geometries
+        tolerance: Distance below which boundaries count as coincident
+        min_length: Shared border length above which two geometries are
+            neighbours
+        jobs: Number of worker processes for the measurements
+        executor: Process pool to run them in (see map_chunks())
+
+    Returns:
+        (neighbors, lengths): sorted neighbour index lists, one per
+        geometry, and the shared border length of each neighbour, in
+        the same order
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    neighbors = [[] for _ in range(len(geometries))]
+    lengths = [[] for _ in range(len(geometries))]
+    if len(geometries) < 2:
+        return neighbors, lengths
+
+    tree = STRtree(geometries)
+    bounds = shapely.bounds(geometries)
+    envelopes = shapely.box(
+        bounds[:, 0] - tolerance,
+        bounds[:, 1] - tolerance,
+        bounds[:, 2] + tolerance,
+        bounds[:, 3] + tolerance,
+    )
+    left, right = tree.query(envelopes)
+    once = left < right
+    left = left[once]
+    right = right[once]
+
+    boundaries = shapely.boundary(geometries)
+    boxes = np.hstack((
+        np.maximum(bounds[left, :2], bounds[right, :2]) - tolerance,
+        np.minimum(bounds[left, 2:], bounds[right, 2:]) + tolerance,
+    ))
+    shared = np.array(
+        map_chunks(
+            partial(_border_lengths, tolerance=tolerance),
+            list(zip(boundaries[left], boundaries[right], boxes.tolist())),
+            jobs,
+            executor,
+        ),
+        dtype=float,
+    )
+    matches = shared > min_length
+
+    for i, j, length in zip(left[matches].tolist(), right[matches].tolist(),
+                            shared[matches].tolist()):
+        neighbors[i].append((j, length))
+        neighbors[j].append((i, length))
+    for position, region_neighbors in enumerate(neighbors):
+        region_neighbors.sort()
+        neighbors[position] = [j for j, _ in region_neighbors]
+        lengths[position] = [length for _, length in region_neighbors]
+    return neighbors, lengths
+
+
+def _write_points(f, points, indent, center, resolution):
+    # Write points relative to center, in grid units if on a grid
+    center_x, center_y = center
+    for x, y in points:
+        offset_x = x - center_x
+        offset_y = y - center_y
+        if resolution is None:
+            f.write(f"{indent}(center_x + {offset_x}, "
+                    f"center_y + {offset_y}),\n")
+        else:
+            f.write(f"{indent}(center_x + {round(offset_x * resolution)} "
+                    f"/ grid_scale, center_y + "
+                    f"{round(offset_y * resolution)} / grid_scale),\n")
 
 
 def write_regions_as_python_function(
-        regions, output_name="regions", output_path=None):
-    """Write regions data as a Python function."""
+        regions, output_name="regions", output_path=None, screen_width=800,
+        screen_height=600, resolution=None):
+    """
+    Write regions data as a Python function.
+
+    Points are written relative to the centre of the screen the regions
+    were generated for; with a resolution (grid units per pixel, see
+    grid_scale()) they are written as integer grid offsets divided by
+    grid_scale, which the function defines.
+    """
+    center = (screen_width / 2, screen_height / 2)
     if output_path is None:
         output_path = f"level_{output_name}.py"
 
@@ -294,7 +1148,10 @@ def write_regions_as_python_function(
                     ' ').title()} map - auto-generated from GeoJSON.\"\"\"\n"
         )
         f.write("    center_x = Config.SCREEN_WIDTH // 2\n")
-        f.write("    center_y = Config.SCREEN_HEIGHT // 2\n\n")
+        f.write("    center_y = Config.SCREEN_HEIGHT // 2\n")
+        if resolution is not None:
+            f.write(f"    grid_scale = {resolution!r}\n")
+        f.write("\n")
         f.write("    regions_data = [\n")
 
         for region in regions:
@@ -302,23 +1159,125 @@ def write_regions_as_python_function(
             f.write(f"            'id': {region['id']},\n")
             f.write(f"            'name': '{region['name']}',\n")
             f.write("            'points': [\n")
-
-            # Write points relative to center
-            for x, y in region["points"]:
-                offset_x = x - 400  # Assuming 800 width
-                offset_y = y - 300  # Assuming 600 height
-                f.write(
-                    f"                (center_x + {offset_x}, center_y + {offset_y}),\n"
-                )
-
+            _write_points(f, region["points"], "                ", center,
+                          resolution)
             f.write("            ],\n")
-            f.write(f"            'neighbors': {region['neighbors']}\n")
+            if "parts" in region:
+                f.write("            'parts': [\n")
+                for part in region["parts"]:
+                    f.write("                [\n")
+                    _write_points(f, part, "                    ", center,
+                                  resolution)
+                    f.write("                ],\n")
+                f.write("            ],\n")
+            if "holes" in region:
+                f.write("            'holes': [\n")
+                for holes in region["holes"]:
+                    f.write("                [\n")
+                    for hole in holes:
+                        f.write("                    [\n")
+                        _write_points(f, hole, "                        ",
+                                      center, resolution)
+                        f.write("                    ],\n")
+                    f.write("                ],\n")
+                f.write("            ],\n")
+            if "lods" in region:
+                f.write("            'lods': [\n")
+                for lod in region["lods"]:
+                    f.write("                {\n")
+                    f.write(f"                    'error': {lod['error']},\n")
+                    f.write("                    'parts': [\n")
+                    for part in lod["parts"]:
+                        f.write("                        [\n")
+                        _write_points(f, part, " " * 28, center,
+                                      resolution)
+                        f.write("                        ],\n")
+                    f.write("                    ],\n")
+                    if "holes" in lod:
+                        f.write("                    'holes': [\n")
+                        for holes in lod["holes"]:
+                            f.write("                        [\n")
+                            for hole in holes:
+                                f.write(" " * 28 + "[\n")
+                                _write_points(f, hole, " " * 32, center,
+                                              resolution)
+                                f.write(" " * 28 + "],\n")
+                            f.write("                        ],\n")
+                        f.write("                    ],\n")
+                    f.write("                },\n")
+                f.write("            ],\n")
+            f.write(f"            'neighbors': {region['neighbors']},\n")
+            if "label" in region:
+                label_x, label_y = region["label"]
+                f.write("            'label': ("
+                        f"center_x + {round(label_x - center[0], 1)}, "
+                        f"center_y + {round(label_y - center[1], 1)}),\n")
+                f.write("            'label_width': "
+                        f"{region['label_width']},\n")
+            if "border_lengths" in region:
+                f.write("            'border_lengths': "
+                        f"{region['border_lengths']},\n")
             f.write("        },\n")
 
         f.write("    ]\n\n")
         f.write("    return regions_data\n")
 
 
+def write_regions_as_level_pack(
+        regions, output_name="regions", output_path=None, tag="countries",
+        description=None, resolution=None):
+    """
+    Write regions data as a single-level binary level pack, with
+    coordinates stored as integers on a grid of resolution units per
+    pixel (whole pixels when None).
+    """
+    if output_path is None:
+        output_path = f"level_{output_name}{PACK_EXTENSION}"
+
+    if description is None:
+        description = f"{len(regions)} regions"
+
+    meta = {
+        "name": output_name.replace("_", " ").title(),
+        "tag": tag,
+        "description": description,
+    }
+    write_level_pack(output_path, [encode_level(regions, meta, resolution)])
+    return output_path
+
+
+def write_regions_as_region_stream(
+        regions, output_name="regions", output_path=None, tag="countries",
+        description=None, resolution=None):
+    """
+    Write regions data as a region stream (see view/level_pack.py): each
+    region is encoded and written as it comes from the regions iterable,
+    on a grid of resolution units per pixel (whole pixels when None),
+    followed by an index of them for reading any one on its own.
+    """
+    if output_path is None:
+        output_path = f"level_{output_name}{STREAM_EXTENSION}"
+
+    meta = {
+        "name": output_name.replace("_", " ").title(),
+        "tag": tag,
+    }
+    count = 0
+    with RegionStreamWriter(output_path, meta, resolution) as writer:
+        for region in regions:
+            writer.write(region)
+            count += 1
+        writer.meta["description"] = description or f"{count} regions"
+    return output_path
+
+
+def _noting_names(regions, names):
+    """Pass regions on, adding the name of each to names"""
+    for region in regions:
+        names.append(region["name"])
+        yield region
+
+
 # Example configurations for different regions
 REGION_CONFIGS = {
     "us_states": {
@@ -342,46 +1301,164 @@ REGION_CONFIGS = {
 
 if __name__ == "__main__":
     # Example usage
-    import sys
-
-    if len(sys.argv) < 2:
-        print(
-            "Usage: python script.py <geojson_file> [region_type] [output_name]")
-        print("Example: python script.py world.geojson world_countries world")
-        print("Available region types:", list(REGION_CONFIGS.keys()))
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Generate Four Color Map levels from a GeoJSON file.",
+        epilog="Example: python -m utils.parser_countries_json "
+        "world.geojson world_countries world",
+    )
+    parser.add_argument("geojson_file")
+    parser.add_argument(
+        "region_type",
+        nargs="?",
+        help=f"One of: {', '.join(REGION_CONFIGS)}")
+    parser.add_argument("output_name", nargs="?")
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Process regions in N worker processes (default: 1)",
+    )
+    parser.add_argument(
+        "--max-points",
+        type=int,
+        default=50,
+        help="Vertex budget per region part (default: 50)",
+    )
+    parser.add_argument(
+        "--total-points",
+        type=int,
+        help="Vertex budget for the whole map",
+    )
+    parser.add_argument(
+        "--min-part-area",
+        type=float,
+        help="Drop islands and exclaves smaller than this many px²",
+    )
+    parser.add_argument(
+        "--min-border-length",
+        type=float,
+        default=1.0,
+        help="Shared border, in px, that makes regions neighbours "
+        "(default: 1)",
+    )
+    parser.add_argument(
+        "--grid-bits",
+        type=int,
+        default=GRID_BITS,
+        help="Round coordinates to 2^N units across the screen, or to "
+        f"whole pixels with 0 (default: {GRID_BITS})",
+    )
+    parser.add_argument(
+        "--lod-levels",
+        type=int,
+        default=LOD_LEVELS,
+        help="Detail levels per region, for drawing the map zoomed out; "
+        f"1 keeps only the full geometry (default: {LOD_LEVELS})",
+    )
+    parser.add_argument(
+        "--reader",
+        choices=READERS,
+        default="auto",
+        help="How to read the input (default: pyogrio if installed)",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Write the time and memory of each import stage as JSON "
+        "('-' for standard output). Memory is the resident set size at "
+        "the end of the stage, its growth during the stage and the "
+        "process's peak so far; run under python -X tracemalloc to also "
+        "get the peak of Python allocations within each stage",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="DIR",
+        help="Keep the read, simplified and neighbour stages in DIR, so "
+        "re-imports with another layout skip them",
+    )
+    parser.add_argument(
+        "--order",
+        choices=REGION_ORDERS,
+        default="dataset",
+        help="Region order: as in the input or along a Hilbert curve, "
+        "keeping nearby regions together (default: dataset)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["python", "pack", "stream"],
+        default="python",
+        help="Write a Python level function, a binary level pack or a "
+        "region stream, written region by region",
+    )
+    args = parser.parse_args()
 
-    geojson_file = sys.argv[1]
-    region_type = sys.argv[2] if len(sys.argv) > 2 else None
+    geojson_file = args.geojson_file
+    region_type = args.region_type
     output_name = (
-        sys.argv[3]
-        if len(sys.argv) > 3
+        args.output_name
+        if args.output_name
         else os.path.splitext(os.path.basename(geojson_file))[0]
     )
 
     # Get configuration
     config = REGION_CONFIGS.get(region_type, {}) if region_type else {}
 
+    profile = StageProfile(
+        input=geojson_file,
+        input_bytes=os.path.getsize(geojson_file),
+        jobs=args.jobs,
+    )
     try:
         # Generate regions from GeoJSON
-        regions = generate_regions_from_geojson(
-            geojson_file,
+        options = dict(
             output_name=output_name,
             scale_factor=2.0,
             screen_width=800,
             screen_height=600,
+            jobs=args.jobs,
+            max_points=args.max_points,
+            total_points=args.total_points,
+            min_part_area=args.min_part_area,
+            min_border_length=args.min_border_length,
+            region_order=args.order,
+            grid_bits=args.grid_bits,
+            lod_levels=args.lod_levels,
+            reader=args.reader,
+            profile=profile,
+            cache=StageCache(args.cache, geojson_file) if args.cache else None,
             **config,  # Unpack the configuration
         )
 
-        # Write to Python file
-        write_regions_as_python_function(regions, output_name)
+        resolution = grid_scale(800, 600, args.grid_bits)
+        if args.format == "stream":
+            # Each region is written as soon as it is made
+            names = []
+            output_path = write_regions_as_region_stream(
+                _noting_names(
+                    iter_regions_from_geojson(geojson_file, **options),
+                    names),
+                output_name, resolution=resolution)
+        else:
+            regions = generate_regions_from_geojson(geojson_file, **options)
+            names = [region["name"] for region in regions]
+        if args.format == "pack":
+            output_path = write_regions_as_level_pack(
+                regions, output_name, resolution=resolution)
+        elif args.format == "python":
+            # Write to Python file
+            output_path = f"level_{output_name}.py"
+            write_regions_as_python_function(
+                regions, output_name, output_path, resolution=resolution)
+        profile.lap("write", bytes=os.path.getsize(output_path))
+        if args.profile:
+            profile.write(args.profile)
 
-        print(f"✅ Successfully generated level_{output_name}.py")
-        print(f"📊 Total regions: {len(regions)}")
-        if regions:
-            print(
-                f"🗺️  Regions included: {', '.join([r['name'] for r in regions[:5]])}..."
-            )
+        print(f"✅ Successfully generated {output_path}")
+        print(f"📊 Total regions: {len(names)}")
+        if names:
+            print(f"🗺️  Regions included: {', '.join(names[:5])}...")
 
     except Exception as e:
         print(f"❌ Error: {e}")
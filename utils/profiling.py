@@ -0,0 +1,121 @@
+# Copyright (C) 2025 Bishoy Wadea
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+Per-stage timing and memory figures for the level tools.
+
+A StageProfile is a lap timer: each lap() closes the stage that began at
+the previous one, recording its wall time, the resident set size at its
+end and how much that grew during the stage, the peak resident set size
+of the process so far, and any counts the caller passes. When
+tracemalloc is tracing (python -X tracemalloc), each stage also gets the
+peak of Python allocations made while it ran. The result
+is plain JSON, so runs on different inputs or revisions can be compared.
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss(who="self"):
+    """
+    Peak resident set size in bytes of this process ("self") or of its
+    largest finished worker process ("children"), or None where the
+    platform does not report it.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(
+        resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kilobytes, except on macOS
+    if sys.platform == "darwin":
+        return usage.ru_maxrss
+    return usage.ru_maxrss * 1024
+
+
+def current_rss():
+    """
+    Current resident set size in bytes of this process, or None where
+    the platform does not report it.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class StageProfile:
+    """Wall time, memory and counts of consecutive stages"""
+
+    def __init__(self, **info):
+        self.info = info
+        self.stages = []
+        self.start = self.last = time.perf_counter()
+        self.last_rss = current_rss()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    def lap(self, name, **counts):
+        """End the current stage, started at the previous lap"""
+        now = time.perf_counter()
+        rss = current_rss()
+        stage = {
+            "stage": name,
+            "seconds": round(now - self.last, 4),
+            "rss": rss,
+            "rss_growth": (rss - self.last_rss
+                           if rss is not None and self.last_rss is not None
+                           else None),
+            # ru_maxrss never goes down: a stage that raises it set the
+            # process peak
+            "peak_rss": peak_rss(),
+        }
+        # The peak within the stage alone comes from tracemalloc, reset
+        # at every lap
+        if tracemalloc.is_tracing():
+            stage["peak_traced"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        stage.update(counts)
+        self.stages.append(stage)
+        self.last = now
+        self.last_rss = rss
+
+    def to_dict(self):
+        return {
+            **self.info,
+            "stages": self.stages,
+            "seconds": round(self.last - self.start, 4),
+            "peak_rss": peak_rss(),
+            "children_peak_rss": peak_rss("children"),
+        }
+
+    def write(self, path):
+        """Write the profile as JSON to a file, or standard output for '-'"""
+        if path == "-":
+            print(json.dumps(self.to_dict()))
+        else:
+            with open(path, "w") as f:
+                json.dump(self.to_dict(), f, indent=1)
@@ -0,0 +1,137 @@
+# Copyright (C) 2025 Bishoy Wadea
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+Spatial ordering of the regions of a level.
+
+Imported regions follow dataset order, which scatters neighbours across
+the region list. Sorting them along a Hilbert curve of their centroids
+puts regions that are close on the map close in the list too, so the
+positions in a grid cell, a region's neighbours and a redrawn area
+each cover a short run of the per-region arrays.
+"""
+
+import numpy as np
+import shapely
+from shapely.geometry import MultiPolygon, Polygon
+
+from view.geometry import polygon_bbox, region_holes, region_parts
+
+# Hilbert curve resolution: a 2^HILBERT_BITS square grid
+HILBERT_BITS = 16
+
+
+def hilbert_index(x, y, bits=HILBERT_BITS):
+    """
+    Position along a Hilbert curve of integer grid coordinates.
+
+    Args:
+        x, y: Integer arrays in [0, 2^bits)
+        bits: Curve order
+
+    Returns:
+        Array of curve positions in [0, 4^bits)
+    """
+    x = np.asarray(x, dtype=np.int64).copy()
+    y = np.asarray(y, dtype=np.int64).copy()
+    last = (1 << bits) - 1
+    index = np.zeros(x.shape, dtype=np.int64)
+    s = 1 << (bits - 1)
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        index += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant so the curve stays continuous
+        flip = ~ry & rx
+        x = np.where(flip, last - x, x)
+        y = np.where(flip, last - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return index
+
+
+def region_centroids(regions):
+    """Area-weighted centroid of every region's parts, as an (n, 2) array"""
+    centroids = []
+    for region in regions:
+        polygons = [Polygon(ring, holes)
+                    for ring, holes in zip(region_parts(region),
+                                           region_holes(region))
+                    if len(ring) >= 3]
+        geometry = MultiPolygon(polygons)
+        if polygons and geometry.area > 0:
+            centroid = shapely.get_coordinates(shapely.centroid(geometry))
+            centroids.append(centroid[0])
+        elif len(region.get('points', [])) >= 1:
+            min_x, min_y, max_x, max_y = polygon_bbox(region['points'])
+            centroids.append(((min_x + max_x) / 2, (min_y + max_y) / 2))
+        else:
+            centroids.append((0.0, 0.0))
+    return np.array(centroids, dtype=float).reshape(-1, 2)
+
+
+def hilbert_order(regions, bits=HILBERT_BITS):
+    """
+    Region positions sorted along a Hilbert curve of their centroids.
+
+    The curve spans the square around all the centroids, so both axes
+    get the same resolution. Ties keep their current order.
+    """
+    return centroid_order(region_centroids(regions), bits)
+
+
+def centroid_order(centroids, bits=HILBERT_BITS):
+    """hilbert_order() of regions by their (n, 2) array of centroids"""
+    centroids = np.asarray(centroids, dtype=float).reshape(-1, 2)
+    if len(centroids) < 2:
+        return list(range(len(centroids)))
+    low = centroids.min(axis=0)
+    extent = max((centroids.max(axis=0) - low).max(), 1e-9)
+    grid = np.floor((centroids - low) / extent * ((1 << bits) - 1))
+    index = hilbert_index(grid[:, 0], grid[:, 1], bits)
+    return np.argsort(index, kind='stable').tolist()
+
+
+def reorder_regions(regions, order):
+    """
+    Return copies of the region dicts in a new order.
+
+    Args:
+        regions: Region dicts whose ids are their positions, as imported
+        order: Current positions, in their new order
+
+    Returns:
+        The reordered regions with ids renumbered to their new positions
+        and 'neighbors' (with their 'border_lengths') remapped and
+        sorted
+    """
+    new_ids = {regions[position]['id']: new_id
+               for new_id, position in enumerate(order)}
+    reordered = []
+    for new_id, position in enumerate(order):
+        region = dict(regions[position], id=new_id)
+        neighbors = [new_ids[neighbor_id]
+                     for neighbor_id in region.get('neighbors', [])]
+        lengths = region.get('border_lengths')
+        if lengths is not None:
+            pairs = sorted(zip(neighbors, lengths))
+            region['neighbors'] = [neighbor for neighbor, _ in pairs]
+            region['border_lengths'] = [length for _, length in pairs]
+        else:
+            region['neighbors'] = sorted(neighbors)
+        reordered.append(region)
+    return reordered
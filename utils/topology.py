@@ -0,0 +1,434 @@
+# Copyright (C) 2025 Bishoy Wadea
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+Shared-border topology for the GeoJSON importer.
+
+Polygon rings are cut into arcs at junctions: vertices whose set of
+adjacent vertices, over all rings, is not exactly two (where a border
+between two regions meets a third region or the coast). A border shared
+by two regions is then a single arc, used forwards by one ring and
+backwards by the other, so anything done to the arc (simplification,
+vertex reduction) happens identically on both sides and cannot open
+slivers between neighbours.
+"""
+
+import heapq
+from math import inf
+
+import numpy as np
+import shapely
+from shapely.geometry import LineString, Polygon
+
+
+def _ring_vertices(ring):
+    """Vertices of a LinearRing, without the closing repeat"""
+    coords = list(ring.coords)
+    if len(coords) > 1 and coords[0] == coords[-1]:
+        coords.pop()
+    # Drop consecutive duplicates, they would look like junctions
+    return [p for k, p in enumerate(coords) if k == 0 or p != coords[k - 1]]
+
+
+def _ring_array(ring):
+    """_ring_vertices() of a LinearRing as an (n, 2) coordinate array"""
+    coords = shapely.get_coordinates(ring)
+    if len(coords) > 1 and (coords[0] == coords[-1]).all():
+        coords = coords[:-1]
+    keep = np.ones(len(coords), dtype=bool)
+    keep[1:] = (coords[1:] != coords[:-1]).any(axis=1)
+    return coords[keep]
+
+
+def _number_points(coords):
+    """
+    The distinct rows of an (n, 2) coordinate array in (x, y) order, and
+    the number of each row's point among them.
+    """
+    order = np.lexsort((coords[:, 1], coords[:, 0]))
+    ordered = coords[order]
+    new = np.ones(len(ordered), dtype=bool)
+    new[1:] = (ordered[1:] != ordered[:-1]).any(axis=1)
+    ids = np.empty(len(coords), dtype=np.int64)
+    ids[order] = np.cumsum(new) - 1
+    return ordered[new], ids
+
+
+def _precedes(a, b):
+    """Whether id sequence a sorts before or equal to b, of the same length"""
+    differ = np.flatnonzero(a != b)
+    return not len(differ) or a[differ[0]] < b[differ[0]]
+
+
+def build_arcs(rings):
+    """
+    Split rings into shared arcs.
+
+    Vertices are numbered in (x, y) order and the rings handled as
+    arrays of those numbers, so the map's full-resolution vertices are
+    never held as Python tuples.
+
+    Args:
+        rings: Iterable of (n, 2) coordinate arrays (or lists of (x, y)
+            vertices), without the closing repeat
+
+    Returns:
+        (arcs, ring_arcs): arcs is a list of (n, 2) coordinate arrays;
+        ring_arcs has one list of (arc index, reversed) per ring, which
+        walked in order gives back the ring. Rings without junctions
+        are a single closed arc (first vertex repeated at the end),
+        shared by every ring with the same vertex cycle, such as an
+        enclave and the hole it fills.
+    """
+    rings = [np.asarray(ring, dtype=float).reshape(-1, 2) for ring in rings]
+    lengths = np.array([len(ring) for ring in rings], dtype=np.int64)
+    if not lengths.sum():
+        return [], [[] for _ in rings]
+    coords = np.concatenate(rings)
+    del rings
+    points, ids = _number_points(coords)
+    del coords
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+
+    # A junction's set of adjacent vertices, over all rings, is not
+    # exactly two. Every vertex is linked to the next one around its
+    # ring, and each distinct link (one int64) counts for both ends.
+    nonempty = lengths > 0
+    following = np.empty_like(ids)
+    following[:-1] = ids[1:]
+    following[ends[nonempty] - 1] = ids[starts[nonempty]]
+    low = np.minimum(ids, following)
+    following = np.maximum(ids, following)
+    count = len(points)
+    links = np.unique(low * count + following)
+    del low, following
+    low, high = np.divmod(links, count)
+    del links
+    degree = np.bincount(low, minlength=count)
+    degree += np.bincount(high[low != high], minlength=count)
+    junctions = degree != 2
+    del low, high, degree
+
+    arcs = []
+    arc_ids = {}
+    ring_arcs = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        ring = ids[start:end]
+        cuts = np.flatnonzero(junctions[ring])
+        if not len(cuts):
+            key, direction = _cycle_key(ring)
+            if key not in arc_ids:
+                arc_ids[key] = (len(arcs), direction)
+                arcs.append(points[np.append(ring, ring[:1])])
+            arc_id, arc_direction = arc_ids[key]
+            ring_arcs.append([(arc_id, direction != arc_direction)])
+            continue
+
+        first = cuts[0]
+        rotated = np.concatenate((ring[first:], ring[:first + 1]))
+        cuts = (cuts - first).tolist() + [len(ring)]
+
+        walk = []
+        for begin, finish in zip(cuts, cuts[1:]):
+            arc = rotated[begin:finish + 1]
+            backwards = arc[::-1]
+            forwards = _precedes(arc, backwards)
+            key = (arc if forwards else backwards).tobytes()
+            if key not in arc_ids:
+                arc_ids[key] = (len(arcs), False)
+                arcs.append(points[arc if forwards else backwards])
+            walk.append((arc_ids[key][0], not forwards))
+        ring_arcs.append(walk)
+
+    return arcs, ring_arcs
+
+
+def _cycle_key(ring):
+    """
+    Key of a ring's vertex cycle (an array of vertex numbers), the same
+    whatever vertex it starts at or the direction it runs in, and that
+    direction (True if reversed).
+    """
+    start = int(np.argmin(ring))
+    forwards = np.concatenate((ring[start:], ring[:start]))
+    backwards = np.concatenate((forwards[:1], forwards[:0:-1]))
+    if not _precedes(forwards, backwards):
+        return ('cycle', backwards.tobytes()), True
+    return ('cycle', forwards.tobytes()), False
+
+
+def assemble_ring(arcs, walk):
+    """Join the arcs of a ring back into a vertex list (not closed)"""
+    ring = []
+    for arc_id, backwards in walk:
+        arc = arcs[arc_id]
+        if backwards:
+            arc = arc[::-1]
+        ring.extend(arc[:-1])
+    return ring
+
+
+def effective_areas(points):
+    """
+    Visvalingam-Whyatt effective area of every vertex of a polyline.
+
+    Repeatedly removes the vertex forming the smallest triangle with its
+    current neighbours (a heap keeps this O(n log n)); a vertex's
+    effective area is the largest triangle removed up to and including
+    it, so keeping the vertices above any threshold gives the
+    Visvalingam-Whyatt result for that many points. The endpoints are
+    never removed and get an infinite area.
+    """
+    count = len(points)
+    areas = [inf] * count
+    if count < 3:
+        return areas
+
+    def triangle(i, j, k):
+        (x1, y1), (x2, y2), (x3, y3) = points[i], points[j], points[k]
+        return abs((x2 - x1) * (y3 - y1) - (x3 - x1) * (y2 - y1)) / 2.0
+
+    previous = list(range(-1, count - 1))
+    following = list(range(1, count + 1))
+    current = [inf] * count
+    heap = []
+    for i in range(1, count - 1):
+        current[i] = triangle(i - 1, i, i + 1)
+        heap.append((current[i], i))
+    heapq.heapify(heap)
+
+    largest = 0.0
+    while heap:
+        area, i = heapq.heappop(heap)
+        if area != current[i] or areas[i] != inf:
+            continue  # Stale entry
+        largest = max(largest, area)
+        areas[i] = largest
+        before = previous[i]
+        after = following[i]
+        following[before] = after
+        previous[after] = before
+        for j in (before, after):
+            if 0 < j < count - 1:
+                current[j] = triangle(previous[j], j, following[j])
+                heapq.heappush(heap, (current[j], j))
+    return areas
+
+
+def reduce_ring(points, max_points):
+    """
+    Pick at most max_points vertices of a closed vertex list.
+
+    The first and last vertices (normally the same point, closing the
+    ring) are always kept; the rest are chosen by effective area.
+
+    Returns:
+        The indices of the kept vertices, in order
+    """
+    if len(points) <= max_points:
+        return list(range(len(points)))
+    areas = effective_areas(points)
+    cutoff = heapq.nlargest(
+        max(max_points, 4), ((area, k) for k, area in enumerate(areas)))[-1]
+    return [k for k, area in enumerate(areas) if (area, k) >= cutoff]
+
+
+def _budget_cutoff(keys, budget):
+    """The smallest key still kept when keeping the budget largest keys"""
+    if budget is None or len(keys) <= budget:
+        return None
+    return heapq.nlargest(max(budget, 3), keys)[-1]
+
+
+def reduce_shared_borders(arcs, ring_arcs, max_points=None,
+                          total_points=None):
+    """
+    Drop arc vertices to meet a vertex budget, keeping borders shared.
+
+    Every arc vertex gets a Visvalingam-Whyatt effective area (arc
+    endpoints, the junctions, are always kept). Each ring picks the
+    cutoff that fits it into max_points, the whole map the one that
+    fits it into total_points, and an arc keeps the vertices above the
+    strictest cutoff of the rings that use it, so both sides of a
+    border keep the same vertices. A ring with more junctions than
+    max_points keeps just its junctions, and every ring keeps at least
+    three vertices, even if that exceeds total_points.
+
+    Returns:
+        The reduced arcs, in the same order
+    """
+    areas = [effective_areas(arc) for arc in arcs]
+
+    # Keep at least three distinct vertices in every ring: a ring with
+    # fewer junctions also keeps its arcs' most significant vertices
+    for walk in ring_arcs:
+        ends = set()
+        for arc_id, _ in walk:
+            ends.update((arcs[arc_id][0], arcs[arc_id][-1]))
+        needed = 3 - len(ends)
+        for arc_id, _ in walk:
+            if needed <= 0:
+                break
+            arc_areas = areas[arc_id]
+            interior = sorted(range(1, len(arc_areas) - 1),
+                              key=lambda k: arc_areas[k], reverse=True)
+            for k in interior[:needed]:
+                arc_areas[k] = inf
+            needed -= len(interior[:needed])
+
+    keys = [[(area, arc_id, k) for k, area in enumerate(arc_areas)]
+            for arc_id, arc_areas in enumerate(areas)]
+
+    cutoffs = [None] * len(arcs)
+
+    def tighten(arc_id, cutoff):
+        if cutoff is None:
+            return
+        if cutoffs[arc_id] is None or cutoff > cutoffs[arc_id]:
+            cutoffs[arc_id] = cutoff
+
+    if total_points is not None:
+        everything = [key for arc_keys in keys for key in arc_keys[:-1]]
+        cutoff = _budget_cutoff(everything, total_points)
+        for arc_id in range(len(arcs)):
+            tighten(arc_id, cutoff)
+
+    if max_points is not None:
+        for walk in ring_arcs:
+            ring_keys = [key for arc_id, _ in walk
+                         for key in keys[arc_id][:-1]]
+            cutoff = _budget_cutoff(ring_keys, max_points)
+            for arc_id, _ in walk:
+                tighten(arc_id, cutoff)
+
+    reduced = []
+    for arc, arc_keys, cutoff in zip(arcs, keys, cutoffs):
+        if cutoff is None:
+            reduced.append(arc)
+        else:
+            reduced.append([p for p, key in zip(arc, arc_keys)
+                            if key >= cutoff])
+    return reduced
+
+
+def simplify_shared_borders(regions, tolerance, max_points=None,
+                            total_points=None):
+    """
+    Simplify region polygons so shared borders stay shared.
+
+    Every arc is simplified once (Douglas-Peucker, junctions kept) and
+    reused by all the rings that contain it, then thinned to the vertex
+    budgets with reduce_shared_borders(). Holes are rings too, so a hole
+    and the enclave filling it keep the same outline. Parts that
+    collapse below three vertices are simplified on their own instead;
+    holes that collapse are dropped. Junctions, the three vertices of
+    every ring and those parts are kept regardless of total_points, so
+    a warning is printed when they overrun it.
+
+    Args:
+        regions: Lists of Shapely Polygons, the parts of each region
+        tolerance: Simplification tolerance
+        max_points: Vertex budget per ring (None for no limit)
+        total_points: Vertex budget for all regions (None for no limit)
+
+    Returns:
+        Lists of simplified Polygons, in input order
+    """
+    groups = []
+    count = 0
+    for parts in regions:
+        group = []
+        for polygon in parts:
+            first = count
+            count += 1 + len(polygon.interiors)
+            group.append((polygon, first, count))
+        groups.append(group)
+
+    # Handed over as a generator, so build_arcs() can drop the rings'
+    # coordinates once it has numbered their vertices
+    arcs, ring_arcs = build_arcs(
+        _ring_array(ring) for parts in regions for polygon in parts
+        for ring in [polygon.exterior, *polygon.interiors])
+
+    lines = shapely.simplify([LineString(arc) for arc in arcs], tolerance,
+                             preserve_topology=False)
+    simplified = [[tuple(p) for p in shapely.get_coordinates(line).tolist()]
+                  for line in lines]
+    simplified = reduce_shared_borders(simplified, ring_arcs, max_points,
+                                       total_points)
+
+    results = []
+    for group in groups:
+        parts = []
+        for polygon, first, last in group:
+            ring = assemble_ring(simplified, ring_arcs[first])
+            holes = [assemble_ring(simplified, ring_arcs[ring_id])
+                     for ring_id in range(first + 1, last)]
+            holes = [hole for hole in holes if len(set(hole)) >= 3]
+            if len(set(ring)) < 3:
+                ring = _ring_vertices(polygon.simplify(tolerance).exterior)
+                ring.append(ring[0])
+                if max_points is not None:
+                    ring = [ring[k] for k in reduce_ring(ring, max_points)]
+            parts.append(Polygon(ring, holes))
+        results.append(parts)
+
+    if total_points is not None:
+        kept = {tuple(point) for parts in results for polygon in parts
+                for point in shapely.get_coordinates(polygon).tolist()}
+        if len(kept) > total_points:
+            print(f"Warning: kept {len(kept)} vertices, over the "
+                  f"total_points budget of {total_points} (junctions, "
+                  f"three per ring and collapsed parts are always kept)")
+    return results
+
+
+def find_border_gaps(reference, polygons, max_area=0.0):
+    """
+    Find gaps that opened between regions.
+
+    A gap is an area enclosed by the regions (a hole in their union)
+    that was covered by the reference polygons, such as a sliver left
+    where two neighbours simplified a shared border differently.
+
+    Args:
+        reference: Polygons before simplification
+        polygons: Polygons after simplification, in the same space
+        max_area: Ignore gaps up to this area
+
+    Returns:
+        Gap polygons larger than max_area, largest first
+    """
+    covered = shapely.union_all(shapely.make_valid(np.asarray(
+        polygons, dtype=object)))
+    holes = [Polygon(interior)
+             for part in getattr(covered, 'geoms', [covered])
+             if part.geom_type == 'Polygon'
+             for interior in part.interiors]
+    if not holes:
+        return []
+
+    land = shapely.union_all(shapely.make_valid(np.asarray(
+        reference, dtype=object)))
+    gaps = []
+    for hole in holes:
+        gap = hole.intersection(land)
+        for part in getattr(gap, 'geoms', [gap]):
+            if part.geom_type == 'Polygon' and part.area > max_area:
+                gaps.append(part)
+    gaps.sort(key=lambda gap: gap.area, reverse=True)
+    return gaps
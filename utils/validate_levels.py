@@ -0,0 +1,230 @@
+# Copyright (C) 2025 Bishoy Wadea
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+Check level geometry and neighbour lists.
+
+Every level of the built-in LEVELS, or of the given level packs, is
+checked for:
+
+    too_few_points: [region, part] rings with fewer than three distinct
+        points, which the game cannot draw or pick
+    invalid: [region, part, reason] parts that are not valid polygons,
+        such as rings that intersect themselves after simplification
+    unknown, self, asymmetric: declared neighbour lists naming a
+        missing region, the region itself, or a region that does not
+        list it back
+    missing: [a, b] regions sharing a border that neither side
+        declares (one-sided declarations appear as asymmetric)
+    extra: [a, b] neighbours declared by a without any shared border
+    overlaps: [a, b, area] regions covering the same area
+    gaps: [x, y, area] areas enclosed by the regions that none covers
+
+Overlaps and gaps smaller than --max-area are ignored. The per-part and
+overlap checks run in --jobs worker processes. With --json the report
+is also written as JSON: {"levels": [{"name", "regions", "issues"}],
+"issue_count"}.
+
+Usage: python -m utils.validate_levels [pack ...] [--tolerance T]
+           [--max-area A] [--jobs N] [--json FILE]
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+from utils.parallel import map_chunks
+from view.adjacency import AdjacencyGraph, derive_neighbors
+from view.adjacency import validate_neighbors
+from view.geometry import region_holes, region_parts
+from view.level_loader import get_level_regions
+from view.level_pack import parse_level_pack
+from view.map_data import LEVELS
+
+
+def _check_parts(parts):
+    """invalid entries for (region, part, polygon) tuples"""
+    reasons = shapely.is_valid_reason(
+        np.array([polygon for _, _, polygon in parts], dtype=object))
+    return [[region_id, part, reason]
+            for (region_id, part, _), reason in zip(parts, reasons)
+            if reason != "Valid Geometry"]
+
+
+def _overlap_areas(pairs):
+    """Area shared by each (polygon, polygon) pair"""
+    columns = np.empty((2, len(pairs)), dtype=object)
+    for k, pair in enumerate(pairs):
+        columns[:, k] = pair
+    return shapely.area(shapely.intersection(*columns)).tolist()
+
+
+def validate_geometry(regions, max_area=1.0, jobs=1):
+    """
+    Check the geometry of a level's regions.
+
+    Returns a dict with the too_few_points, invalid, overlaps and gaps
+    lists described in the module docstring.
+    """
+    report = {'too_few_points': []}
+    parts = []
+    for region in regions:
+        for part, (ring, holes) in enumerate(
+                zip(region_parts(region), region_holes(region))):
+            if len(set(map(tuple, ring))) < 3:
+                report['too_few_points'].append([region['id'], part])
+            else:
+                parts.append((region['id'], part, Polygon(ring, holes)))
+    report['invalid'] = map_chunks(_check_parts, parts, jobs)
+
+    owners = np.array([region_id for region_id, _, _ in parts])
+    polygons = shapely.make_valid(np.array(
+        [polygon for _, _, polygon in parts], dtype=object))
+
+    # Two parts cannot share more area than their bounding boxes do,
+    # which rules out neighbours that only meet along their border
+    report['overlaps'] = []
+    if len(polygons):
+        left, right = shapely.STRtree(polygons).query(polygons)
+        bounds = shapely.bounds(polygons)
+        low = np.maximum(bounds[left, :2], bounds[right, :2])
+        high = np.minimum(bounds[left, 2:], bounds[right, 2:])
+        sides = np.clip(high - low, 0, None)
+        keep = (left < right) & (owners[left] != owners[right])
+        keep &= sides[:, 0] * sides[:, 1] > max_area
+        left = left[keep]
+        right = right[keep]
+        areas = map_chunks(
+            _overlap_areas, list(zip(polygons[left], polygons[right])), jobs)
+        overlaps = {}
+        for a, b, area in zip(owners[left].tolist(),
+                              owners[right].tolist(), areas):
+            key = (min(a, b), max(a, b))
+            overlaps[key] = overlaps.get(key, 0.0) + area
+        report['overlaps'] = [[a, b, round(area, 1)]
+                              for (a, b), area in sorted(overlaps.items())
+                              if area > max_area]
+
+    report['gaps'] = []
+    covered = shapely.union_all(polygons)
+    for piece in getattr(covered, 'geoms', [covered]):
+        if piece.geom_type != 'Polygon':
+            continue
+        for interior in piece.interiors:
+            gap = Polygon(interior)
+            if gap.area > max_area:
+                point = gap.representative_point()
+                report['gaps'].append(
+                    [round(point.x, 1), round(point.y, 1),
+                     round(gap.area, 1)])
+    report['gaps'].sort(key=lambda gap: gap[2], reverse=True)
+    return report
+
+
+def validate_level(level, tolerance=None, max_area=1.0, jobs=1):
+    """Geometry and neighbour report of one level, as a dict of lists"""
+    regions = get_level_regions(level, derive_neighbors=False)
+    if tolerance is None:
+        tolerance = level.get('neighbor_tolerance', 0)
+    report = validate_geometry(regions, max_area, jobs)
+    derived = derive_neighbors(regions, tolerance)
+    graph = AdjacencyGraph.from_regions(regions)
+    for kind, items in validate_neighbors(regions, derived,
+                                          graph=graph).items():
+        report[kind] = [list(item) if isinstance(item, tuple) else item
+                        for item in items]
+    return regions, report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check level geometry and neighbour lists.")
+    parser.add_argument(
+        "packs",
+        nargs="*",
+        help="Level packs to check (default: the built-in levels)",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=None,
+        help="Snap grid for matching borders (default: the level's "
+        "'neighbor_tolerance', or exact)",
+    )
+    parser.add_argument(
+        "--max-area",
+        type=float,
+        default=1.0,
+        help="Ignore overlaps and gaps up to this area (default: 1)",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        metavar="N",
+        help="Check N chunks at a time (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--json",
+        metavar="FILE",
+        help="Also write the report as JSON ('-' for standard output)",
+    )
+    args = parser.parse_args()
+
+    levels = LEVELS
+    if args.packs:
+        levels = []
+        for path in args.packs:
+            with open(path, 'rb') as f:
+                levels.extend(parse_level_pack(f.read(), path))
+
+    results = []
+    problems = 0
+    for level in levels:
+        regions, report = validate_level(
+            level, args.tolerance, args.max_area, args.jobs)
+        issues = sum(len(items) for items in report.values())
+        problems += issues
+        results.append({
+            "name": level['name'],
+            "regions": len(regions),
+            "issues": report,
+        })
+        if args.json != '-':
+            print(f"{level['name']}: {len(regions)} regions, "
+                  f"{issues} issues")
+            for kind, items in report.items():
+                if items:
+                    print(f"  {kind}: {items}")
+
+    if args.json:
+        document = {"levels": results, "issue_count": problems}
+        if args.json == '-':
+            print(json.dumps(document))
+        else:
+            with open(args.json, 'w') as f:
+                json.dump(document, f, indent=1)
+
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,319 @@
+# This file is part of the Four Color Map game.
+# Copyright (C) 2025 Bishoy Wadea
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+Region adjacency derived from geometry.
+
+Two regions are neighbours when a stretch of border of non-zero length
+lies on both of their rings. Every edge is snapped to an integer grid
+and hashed by the line it lies on (reduced direction plus offset), so
+shared edges land in the same bucket even when one side splits the
+border at extra vertices (T-junctions). Each bucket is then swept for
+overlapping intervals that belong to different regions. Hashing is
+O(total vertices); the sweeps only sort the few edges that share a line.
+"""
+
+from array import array
+from bisect import bisect_left
+from math import gcd
+
+# Grid used to snap coordinates when no tolerance is given
+EXACT_QUANTUM = 1e-3
+
+
+def _snap(value, quantum):
+    return int(round(value / quantum))
+
+
+def _ring_edges(points, quantum):
+    """Yield each edge of a ring as snapped integer endpoints"""
+    if len(points) < 2:
+        return
+    snapped = [(_snap(x, quantum), _snap(y, quantum)) for x, y in points]
+    previous = snapped[-1]
+    for current in snapped:
+        if current != previous:
+            yield previous, current
+        previous = current
+
+
+def _region_rings(region):
+    """Every ring of a region, holes included (an enclave's border)"""
+    rings = list(region.get('parts') or [region.get('points', [])])
+    for holes in region.get('holes') or []:
+        rings.extend(holes)
+    return rings
+
+
+def derive_neighbors(regions, tolerance=0):
+    """
+    Compute neighbour lists from shared borders.
+
+    Args:
+        regions: Region dicts with 'id' and 'points' (and optional
+            'parts' and 'holes')
+        tolerance: Snap vertices to a grid of this size before matching,
+            so borders that are only nearly coincident still match
+
+    Returns:
+        Dict mapping region id to a sorted list of neighbour ids
+    """
+    quantum = tolerance if tolerance > 0 else EXACT_QUANTUM
+    lines = {}
+    for region in regions:
+        region_id = region['id']
+        for ring in _region_rings(region):
+            for (x1, y1), (x2, y2) in _ring_edges(ring, quantum):
+                dx = x2 - x1
+                dy = y2 - y1
+                divisor = gcd(dx, dy)
+                dx //= divisor
+                dy //= divisor
+                if dx < 0 or (dx == 0 and dy < 0):
+                    dx = -dx
+                    dy = -dy
+                offset = dx * y1 - dy * x1
+                t1 = x1 * dx + y1 * dy
+                t2 = x2 * dx + y2 * dy
+                if t1 > t2:
+                    t1, t2 = t2, t1
+                lines.setdefault((dx, dy, offset), []).append(
+                    (t1, t2, region_id))
+
+    neighbors = {region['id']: set() for region in regions}
+    for intervals in lines.values():
+        if len(intervals) < 2:
+            continue
+        intervals.sort()
+        for i, (start, end, region_id) in enumerate(intervals):
+            for other_start, _, other_id in intervals[i + 1:]:
+                if other_start >= end:
+                    break
+                if other_id != region_id:
+                    neighbors[region_id].add(other_id)
+                    neighbors[other_id].add(region_id)
+
+    return {region_id: sorted(ids) for region_id, ids in neighbors.items()}
+
+
+def check_neighbor_lists(declared):
+    """
+    Check declared neighbour lists against each other.
+
+    Args:
+        declared: Dict mapping region id to its declared neighbour ids
+
+    Returns a dict of issue lists:
+        unknown: (region, neighbour) pairs naming an id not in the level
+        self: regions listing themselves
+        asymmetric: (a, b) where a lists b but b does not list a
+    """
+    report = {
+        'unknown': [],
+        'self': [],
+        'asymmetric': [],
+    }
+    for region_id in sorted(declared):
+        for neighbor_id in sorted(set(declared[region_id])):
+            if neighbor_id == region_id:
+                report['self'].append(region_id)
+            elif neighbor_id not in declared:
+                report['unknown'].append((region_id, neighbor_id))
+            elif region_id not in declared[neighbor_id]:
+                report['asymmetric'].append((region_id, neighbor_id))
+    return report
+
+
+def validate_neighbors(regions, derived=None, tolerance=0, graph=None):
+    """
+    Check a level's adjacency, as loaded into an AdjacencyGraph, against
+    the geometry.
+
+    Returns the graph's check_neighbor_lists() report plus:
+        missing: (a, b) sharing a border that neither declares
+        extra: (a, b) declared adjacent without any shared border
+    """
+    if derived is None:
+        derived = derive_neighbors(regions, tolerance)
+    if graph is None:
+        graph = AdjacencyGraph.from_regions(regions)
+
+    report = {'unknown': [], 'self': [], 'asymmetric': []}
+    for kind, items in graph.issues.items():
+        report[kind] = list(items)
+
+    ids = graph.ids
+    positions = graph.positions
+    declared = set(graph.edges())
+    actual = set()
+    for region_id, neighbor_ids in derived.items():
+        for neighbor_id in neighbor_ids:
+            if region_id in positions and neighbor_id in positions:
+                i, j = positions[region_id], positions[neighbor_id]
+                actual.add((min(i, j), max(i, j)))
+    report['missing'] = [(ids[i], ids[j])
+                         for i, j in sorted(actual - declared)]
+    report['extra'] = [(ids[i], ids[j])
+                       for i, j in sorted(declared - actual)]
+    return report
+
+
+class AdjacencyGraph:
+    """
+    Immutable, symmetric region adjacency in compressed sparse row form.
+
+    Regions are addressed by position (their index in the level's region
+    list). The neighbours of position i are
+    indices[offsets[i]:offsets[i + 1]], sorted; both arrays are
+    read-only memoryviews over contiguous int arrays.
+
+    Build it with from_neighbor_lists() or from_regions(), which check the
+    declared lists once at load: self-loops and unknown ids are dropped,
+    one-sided entries are mirrored, and what was fixed is kept in
+    'issues' (see check_neighbor_lists).
+
+    When the level gives border lengths, 'weights' holds the length of
+    each adjacency in the same layout as 'indices' (0 where a length is
+    unknown); otherwise it is None.
+    """
+
+    __slots__ = ('ids', 'positions', 'offsets', 'indices', 'weights',
+                 'issues')
+
+    def __init__(self, ids, offsets, indices, issues=None, weights=None):
+        self.ids = tuple(ids)
+        self.positions = {region_id: i for i, region_id in enumerate(ids)}
+        self.offsets = memoryview(array('i', offsets)).toreadonly()
+        self.indices = memoryview(array('i', indices)).toreadonly()
+        self.weights = None
+        if weights is not None:
+            self.weights = memoryview(array('i', weights)).toreadonly()
+        self.issues = issues or {}
+        if len(self.offsets) != len(self.ids) + 1 or \
+                self.offsets[-1] != len(self.indices):
+            raise ValueError("adjacency offsets do not match the regions")
+        if any(not 0 <= j < len(self.ids) for j in self.indices):
+            raise ValueError("adjacency refers to an unknown region")
+        if weights is not None and len(self.weights) != len(self.indices):
+            raise ValueError("adjacency weights do not match the edges")
+
+    @classmethod
+    def from_neighbor_lists(cls, ids, neighbor_lists, length_lists=None):
+        """
+        Build from region ids and their declared neighbour id lists, and
+        optionally the border length of each declared neighbour (None
+        for a region without lengths). A border listed by both sides
+        keeps the longer length.
+        """
+        ids = list(ids)
+        declared = dict(zip(ids, neighbor_lists))
+        issues = check_neighbor_lists(declared)
+
+        positions = {region_id: i for i, region_id in enumerate(ids)}
+        adjacent = [{} for _ in ids]
+        if length_lists is None:
+            length_lists = [None] * len(ids)
+        for i, (neighbor_ids, lengths) in enumerate(
+                zip(neighbor_lists, length_lists)):
+            if lengths is None:
+                lengths = [0] * len(neighbor_ids)
+            for neighbor_id, length in zip(neighbor_ids, lengths):
+                j = positions.get(neighbor_id)
+                if j is not None and j != i:
+                    length = max(length, adjacent[i].get(j, 0))
+                    adjacent[i][j] = length
+                    adjacent[j][i] = length
+
+        offsets = [0]
+        indices = []
+        weights = []
+        for neighbors in adjacent:
+            for j in sorted(neighbors):
+                indices.append(j)
+                weights.append(neighbors[j])
+            offsets.append(len(indices))
+
+        if not any(lengths is not None for lengths in length_lists):
+            weights = None
+        return cls(ids, offsets, indices,
+                   {kind: items for kind, items in issues.items() if items},
+                   weights)
+
+    @classmethod
+    def from_regions(cls, regions):
+        return cls.from_neighbor_lists(
+            [region['id'] for region in regions],
+            [region.get('neighbors', []) for region in regions],
+            [region.get('border_lengths') for region in regions])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def neighbors(self, position):
+        """Positions adjacent to a position"""
+        return self.indices[self.offsets[position]:self.offsets[position + 1]]
+
+    def neighbor_ids(self, region_id):
+        ids = self.ids
+        return [ids[j] for j in self.neighbors(self.positions[region_id])]
+
+    def border_length(self, position, other):
+        """
+        Length of the border between two adjacent positions, or None if
+        the level gives no lengths.
+        """
+        if self.weights is None:
+            return None
+        start = self.offsets[position]
+        neighbors = self.neighbors(position)
+        k = bisect_left(neighbors, other)
+        if k == len(neighbors) or neighbors[k] != other:
+            raise KeyError(f"positions {position} and {other} are not "
+                           "adjacent")
+        return self.weights[start + k]
+
+    def edges(self):
+        """Yield every adjacency once, as (position, position) with i < j"""
+        offsets = self.offsets
+        indices = self.indices
+        for i in range(len(self.ids)):
+            for k in range(offsets[i], offsets[i + 1]):
+                if indices[k] > i:
+                    yield i, indices[k]
+
+    def conflicts(self, colors_by_id):
+        """
+        Return the (id, id) pairs of neighbours sharing a color.
+
+        Args:
+            colors_by_id: Mapping of region id to color; regions missing
+                from it (or mapped to None) are uncolored
+        """
+        ids = self.ids
+        pairs = []
+        for i, j in self.edges():
+            color = colors_by_id.get(ids[i])
+            if color is not None and color == colors_by_id.get(ids[j]):
+                pairs.append((ids[i], ids[j]))
+        return pairs
+
+
+def apply_derived_neighbors(regions, tolerance=0):
+    """Return copies of the region dicts with geometry-derived neighbours"""
+    derived = derive_neighbors(regions, tolerance)
+    return [dict(region, neighbors=derived[region['id']])
+            for region in regions]
@@ -16,15 +16,25 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
 import time
-import math
+from array import array
 from enum import Enum
 from gi.repository import cairo
 
+from view.geometry import (
+    lod_for_scale,
+    point_in_part,
+    region_holes,
+    region_parts,
+)
+from view.level_loader import LevelIndex, get_level_index, get_level_regions
+
+
 class GameMode(Enum):
     MENU = 1
     PLAYING = 2
     COMPLETED = 3
 
+
 class Config:
     GAME_COLORS = [
         (255, 100, 100),
@@ -39,52 +49,202 @@ class Config:
     SELECTED_COLOR = (255, 255, 255)
     BORDER_WIDTH = 2
 
+
+UNCOLORED_INDEX = -1
+
+# Labels are shrunk to fit their region, but not below this size
+MIN_LABEL_FONT_SIZE = 6
+
+
+class RegionStore:
+    """Per-region state of a level kept in parallel arrays.
+
+    Colors, bounding boxes and label anchors live in flat arrays indexed
+    by region position; adjacency is the level's AdjacencyGraph, stored
+    in compressed sparse row form over the same positions.
+    Coloring goes through set_color, which keeps running counts of
+    uncolored regions and conflicting borders so completion checks do
+    not have to rescan the map.
+    """
+
+    __slots__ = ('ids', 'names', 'points', 'parts', 'holes', 'lods',
+                 'positions',
+                 'colors', 'bboxes', 'anchors', 'label_widths', 'graph',
+                 'uncolored_count',
+                 'conflict_count')
+
+    def __init__(self, regions_data, level_index=None):
+        if level_index is None:
+            level_index = LevelIndex.build(regions_data)
+
+        count = len(regions_data)
+        self.ids = list(level_index.ids)
+        self.names = [region.get('name', f"Region {region['id']}")
+                      for region in regions_data]
+        self.points = [region.get('points', []) for region in regions_data]
+        # Only multipart regions have a 'parts' list and only regions
+        # with holes a 'holes' list (None otherwise), so the others cost
+        # no lists of their own
+        self.parts = [region.get('parts') for region in regions_data]
+        self.holes = [region.get('holes') for region in regions_data]
+        self.lods = [region.get('lods') or () for region in regions_data]
+        self.positions = level_index.positions
+        self.colors = array('b', [UNCOLORED_INDEX]) * count
+        self.uncolored_count = count
+        self.conflict_count = 0
+
+        self.bboxes = array('d', [0.0]) * (4 * count)
+        self.anchors = array('d', [0.0]) * (2 * count)
+        self.label_widths = array('d', level_index.label_widths)
+        for i in range(count):
+            if level_index.bboxes[i]:
+                self.bboxes[4 * i:4 * i + 4] = array(
+                    'd', level_index.bboxes[i])
+            if level_index.anchors[i]:
+                self.anchors[2 * i:2 * i + 2] = array(
+                    'd', level_index.anchors[i])
+
+        self.graph = level_index.graph
+
+    def __len__(self):
+        return len(self.ids)
+
+    def set_color(self, position, color_index):
+        """Color a region, keeping the uncolored and conflict counts"""
+        colors = self.colors
+        old = colors[position]
+        if old == color_index:
+            return
+
+        for neighbor in self.graph.neighbors(position):
+            neighbor_color = colors[neighbor]
+            if neighbor_color == UNCOLORED_INDEX:
+                continue
+            if neighbor_color == old:
+                self.conflict_count -= 1
+            elif neighbor_color == color_index:
+                self.conflict_count += 1
+
+        if old == UNCOLORED_INDEX:
+            self.uncolored_count -= 1
+        elif color_index == UNCOLORED_INDEX:
+            self.uncolored_count += 1
+        colors[position] = color_index
+
+    def all_colored(self):
+        return self.uncolored_count == 0
+
+    def has_conflict(self):
+        """Whether two colored neighbours share a color"""
+        return self.conflict_count > 0
+
+    def clear_colors(self):
+        self.colors = array('b', [UNCOLORED_INDEX]) * len(self.ids)
+        self.uncolored_count = len(self.ids)
+        self.conflict_count = 0
+
+
 class Region:
-    def __init__(self, region_id, points, name="", neighbors=None):
-        self.id = region_id
-        self.points = points
-        self.name = name
-        self.color_index = None
-        self.neighbors = set(neighbors or [])
-        
+    """Lightweight handle on one region of a RegionStore"""
+
+    __slots__ = ('_store', '_position')
+
+    def __init__(self, store, position):
+        self._store = store
+        self._position = position
+
+    @property
+    def id(self):
+        return self._store.ids[self._position]
+
+    @property
+    def name(self):
+        return self._store.names[self._position]
+
+    @property
+    def points(self):
+        return self._store.points[self._position]
+
+    @property
+    def parts(self):
+        """All rings of the region; the first is its main part"""
+        parts = self._store.parts[self._position]
+        return parts or [self._store.points[self._position]]
+
+    @property
+    def holes(self):
+        """The holes of each part, as lists of rings"""
+        holes = self._store.holes[self._position]
+        return holes or [()] * len(self.parts)
+
+    def detail(self, scale):
+        """
+        Parts and holes to draw at scale pixels per map unit: the
+        coarsest of the region's 'lods' that stays within a pixel of
+        its full geometry, or the full geometry.
+        """
+        lod = lod_for_scale(self._store.lods[self._position], scale)
+        if lod is None:
+            return self.parts, self.holes
+        return region_parts(lod), region_holes(lod)
+
+    @property
+    def anchor(self):
+        """Where the region's label is centred, in map coordinates"""
+        anchors = self._store.anchors
+        i = 2 * self._position
+        return anchors[i], anchors[i + 1]
+
+    @property
+    def label_width(self):
+        """Widest label that fits around the anchor, in map units"""
+        return self._store.label_widths[self._position]
+
+    @property
+    def neighbors(self):
+        store = self._store
+        return [store.ids[i] for i in store.graph.neighbors(self._position)]
+
+    @property
+    def color_index(self):
+        color_index = self._store.colors[self._position]
+        return None if color_index == UNCOLORED_INDEX else color_index
+
     def set_color(self, color_index):
         """Set the region's color by index"""
-        self.color_index = color_index
-        
+        self._store.set_color(
+            self._position,
+            UNCOLORED_INDEX if color_index is None else color_index)
+
     def get_color(self):
         """Get the region's current color as RGB tuple"""
-        if self.color_index is not None:
-            return Config.GAME_COLORS[self.color_index]
+        color_index = self.color_index
+        if color_index is not None:
+            return Config.GAME_COLORS[color_index]
         return Config.UNCOLORED
-        
+
     def contains_point(self, x, y):
-        """Point-in-polygon test using ray casting algorithm"""
-        if len(self.points) < 3:
+        """Bounding box check followed by a ray casting test"""
+        bboxes = self._store.bboxes
+        i = 4 * self._position
+        min_x, min_y, max_x, max_y = bboxes[i:i + 4]
+        if not (min_x <= x <= max_x and min_y <= y <= max_y):
             return False
-            
-        inside = False
-        j = len(self.points) - 1
-        
-        for i in range(len(self.points)):
-            xi, yi = self.points[i]
-            xj, yj = self.points[j]
-            
-            if ((yi > y) != (yj > y)) and (x < (xj - xi) * (y - yi) / (yj - yi) + xi):
-                inside = not inside
-            j = i
-            
-        return inside
+        return any(point_in_part(x, y, ring, holes)
+                   for ring, holes in zip(self.parts, self.holes))
+
 
 class GameEngine:
     def __init__(self):
         self.config = Config()
         self.mode = GameMode.MENU
         self.regions = {}
+        self.region_store = None
         self.selected_color = 0
         self.eraser_mode = False
         self.current_level = None
         self.start_time = None
-        
+
         self.zoom_level = 1.0
         self.min_zoom = 0.3
         self.max_zoom = 5.0
@@ -92,132 +252,128 @@ class GameEngine:
         self.pan_offset = [0, 0]
         self.is_panning = False
         self.pan_start = None
-        
+
         self.history = []
-        
+
     def set_mode(self, mode):
         """Set the current game mode"""
         self.mode = mode
-        
+
     def start_level(self, level_data):
         """Start a new level"""
         self.current_level = level_data
         self.mode = GameMode.PLAYING
         self.start_time = time.time()
         self.history = []
-        
-        regions_data = []
-        if 'data_func' in level_data:
-            try:
-                regions_data = level_data['data_func']()
-            except Exception as e:
-                regions_data = []
-        elif 'regions' in level_data:
-            regions_data = level_data['regions']
-        
-        self.regions = {}
-        for region_data in regions_data:
-            region = Region(
-                region_data['id'],
-                region_data['points'],
-                region_data.get('name', f"Region {region_data['id']}"),
-                region_data.get('neighbors', [])
-            )
-            self.regions[region_data['id']] = region
-            
+
+        try:
+            regions_data = get_level_regions(level_data)
+            level_index = get_level_index(level_data, regions_data)
+        except Exception:
+            regions_data = []
+            level_index = None
+
+        self.region_store = RegionStore(regions_data, level_index)
+        self.regions = {
+            region_id: Region(self.region_store, position)
+            for position, region_id in enumerate(self.region_store.ids)
+        }
+
         self._fit_map_to_screen()
-        
+
     def _fit_map_to_screen(self):
         """Fit the map to screen with padding"""
         if not self.regions:
             return
         all_points = []
         for region in self.regions.values():
-            all_points.extend(region.points)
-            
+            for ring in region.parts:
+                all_points.extend(ring)
+
         if not all_points:
             return
-            
+
         min_x = min(p[0] for p in all_points)
         max_x = max(p[0] for p in all_points)
         min_y = min(p[1] for p in all_points)
         max_y = max(p[1] for p in all_points)
-        
+
         map_width = max_x - min_x
         map_height = max_y - min_y
-        
+
         if map_width > 0 and map_height > 0:
             screen_width = 800
             screen_height = 600
-            
+
             zoom_x = (screen_width * 0.8) / map_width
             zoom_y = (screen_height * 0.8) / map_height
-            
+
             self.zoom_level = min(zoom_x, zoom_y)
-            self.zoom_level = max(self.min_zoom, min(self.max_zoom, self.zoom_level))
-            
+            self.zoom_level = max(self.min_zoom,
+                                  min(self.max_zoom, self.zoom_level))
+
             map_center_x = (min_x + max_x) / 2
             map_center_y = (min_y + max_y) / 2
-            
+
             self.pan_offset = [
                 screen_width / 2 - map_center_x * self.zoom_level,
                 screen_height / 2 - map_center_y * self.zoom_level
             ]
-    
+
     def get_elapsed_time(self):
         """Get elapsed time since level start"""
         if self.start_time and self.mode == GameMode.PLAYING:
             return time.time() - self.start_time
         return 0
-        
+
     def select_color(self, color_index):
         """Select a color for painting"""
         self.selected_color = color_index
         self.eraser_mode = False
-        
+
     def select_eraser(self):
         """Select eraser mode"""
         self.eraser_mode = True
-        
+
     def world_to_screen(self, world_x, world_y):
         """Convert world coordinates to screen coordinates"""
         screen_x = world_x * self.zoom_level + self.pan_offset[0]
         screen_y = world_y * self.zoom_level + self.pan_offset[1]
         return (screen_x, screen_y)
-        
+
     def screen_to_world(self, screen_x, screen_y):
         """Convert screen coordinates to world coordinates"""
         world_x = (screen_x - self.pan_offset[0]) / self.zoom_level
         world_y = (screen_y - self.pan_offset[1]) / self.zoom_level
         return (world_x, world_y)
-        
+
     def handle_click(self, x, y, button):
         """Handle mouse click"""
         if button == 1:
             world_x, world_y = self.screen_to_world(x, y)
-            
+
             for region in self.regions.values():
                 if region.contains_point(world_x, world_y):
                     self.history.append({
                         'region_id': region.id,
                         'old_color': region.color_index
                     })
-                    
+
                     if self.eraser_mode:
                         region.set_color(None)
                     else:
                         region.set_color(self.selected_color)
                     break
-                    
+
         elif button == 2 or button == 3:
             self.is_panning = True
             self.pan_start = (x, y)
-            
+
     def handle_button_release(self, x, y, button):
         """Handle mouse button release"""
         if button == 2 or button == 3:
             self.is_panning = False
-            
+
     def handle_mouse_motion(self, x, y):
         """Handle mouse motion"""
         if self.is_panning and self.pan_start:
@@ -226,38 +382,42 @@ class GameEngine:
             self.pan_offset[0] += dx
             self.pan_offset[1] += dy
             self.pan_start = (x, y)
-            
+
     def zoom_in(self, center_x=None, center_y=None):
         """Zoom in, optionally around a point"""
         if center_x is not None and center_y is not None:
             self._zoom_at_point(center_x, center_y, 1 + self.zoom_speed)
         else:
-            self.zoom_level = min(self.zoom_level * (1 + self.zoom_speed), self.max_zoom)
-            
+            self.zoom_level = min(self.zoom_level * (1 + self.zoom_speed),
+                                  self.max_zoom)
+
     def zoom_out(self, center_x=None, center_y=None):
         """Zoom out, optionally around a point"""
         if center_x is not None and center_y is not None:
             self._zoom_at_point(center_x, center_y, 1 - self.zoom_speed)
         else:
-            self.zoom_level = max(self.zoom_level * (1 - self.zoom_speed), self.min_zoom)
-            
+            self.zoom_level = max(self.zoom_level * (1 - self.zoom_speed),
+                                  self.min_zoom)
+
     def _zoom_at_point(self, center_x, center_y, zoom_factor):
         """Zoom in/out around a specific point"""
         old_world_pos = self.screen_to_world(center_x, center_y)
-        
-        self.zoom_level = max(self.min_zoom, min(self.max_zoom, self.zoom_level * zoom_factor))
-        
+
+        self.zoom_level = max(
+            self.min_zoom,
+            min(self.max_zoom, self.zoom_level * zoom_factor))
+
         new_world_pos = self.screen_to_world(center_x, center_y)
-        
+
         dx = (old_world_pos[0] - new_world_pos[0]) * self.zoom_level
         dy = (old_world_pos[1] - new_world_pos[1]) * self.zoom_level
         self.pan_offset[0] += dx
         self.pan_offset[1] += dy
-        
+
     def reset_zoom(self):
         """Reset zoom and pan to fit map"""
         self._fit_map_to_screen()
-        
+
     def undo(self):
         """Undo the last action"""
         if self.history:
@@ -265,130 +425,134 @@ class GameEngine:
             region = self.regions.get(last_action['region_id'])
             if region:
                 region.set_color(last_action['old_color'])
-                
+
     def clear_map(self):
         """Clear all colors from the map"""
-        for region in self.regions.values():
-            region.set_color(None)
+        if self.region_store:
+            self.region_store.clear_colors()
         self.history = []
-        
+
     def is_puzzle_complete(self):
         """Check if the puzzle is complete (all regions colored and valid)"""
-        if not self.regions:
+        store = self.region_store
+        if not store:
             return False
-            
-        for region in self.regions.values():
-            if region.color_index is None:
-                return False
-                
-        for region in self.regions.values():
-            region_color = region.color_index
-            for neighbor_id in region.neighbors:
-                neighbor = self.regions.get(neighbor_id)
-                if neighbor and neighbor.color_index == region_color:
-                    return False
-                    
-        return True
-        
+
+        return store.all_colored() and not store.has_conflict()
+
     def draw(self, cr, width, height):
         """Draw the game using Cairo"""
-        if hasattr(self, '_screen_width') and (self._screen_width != width or self._screen_height != height):
+        if hasattr(self, '_screen_width') and (
+                (self._screen_width, self._screen_height) != (width, height)):
             self._fit_map_to_screen()
         self._screen_width = width
         self._screen_height = height
-        
+
         cr.set_source_rgb(0.95, 0.95, 0.95)
         cr.paint()
-        
+
         for region in self.regions.values():
             self._draw_region(cr, region)
-            
+
         if self.is_puzzle_complete():
             self._draw_completion_overlay(cr, width, height)
-            
+
     def _draw_region(self, cr, region):
         """Draw a single region"""
         if len(region.points) < 3:
             return
-            
-        screen_points = [self.world_to_screen(x, y) for x, y in region.points]
-        
+
         cr.new_path()
-        cr.move_to(screen_points[0][0], screen_points[0][1])
-        for point in screen_points[1:]:
-            cr.line_to(point[0], point[1])
-        cr.close_path()
-        
+        for part, holes in zip(*region.detail(self.zoom_level)):
+            if len(part) < 3:
+                continue
+            for ring in [part, *holes]:
+                ring_points = [self.world_to_screen(x, y) for x, y in ring]
+                cr.move_to(ring_points[0][0], ring_points[0][1])
+                for point in ring_points[1:]:
+                    cr.line_to(point[0], point[1])
+                cr.close_path()
+
         color = region.get_color()
-        cr.set_source_rgb(color[0]/255.0, color[1]/255.0, color[2]/255.0)
+        cr.set_source_rgb(color[0] / 255.0, color[1] / 255.0, color[2] / 255.0)
+        # Holes (enclaves) are left unpainted
+        cr.set_fill_rule(cairo.FILL_RULE_EVEN_ODD)
         cr.fill_preserve()
-        
+
         border_width = max(1, self.config.BORDER_WIDTH * self.zoom_level)
         cr.set_line_width(border_width)
         cr.set_source_rgb(
-            self.config.BORDER_COLOR[0]/255.0, 
-            self.config.BORDER_COLOR[1]/255.0, 
-            self.config.BORDER_COLOR[2]/255.0
+            self.config.BORDER_COLOR[0] / 255.0,
+            self.config.BORDER_COLOR[1] / 255.0,
+            self.config.BORDER_COLOR[2] / 255.0
         )
         cr.stroke()
-        
+
         if self.zoom_level > 1.0 and region.name:
-            self._draw_region_label(cr, region, screen_points)
-            
-    def _draw_region_label(self, cr, region, screen_points):
-        """Draw region name label"""
-        center_x = sum(p[0] for p in screen_points) / len(screen_points)
-        center_y = sum(p[1] for p in screen_points) / len(screen_points)
-        
+            self._draw_region_label(cr, region)
+
+    def _draw_region_label(self, cr, region):
+        """Draw region name label at its stored anchor"""
+        center_x, center_y = self.world_to_screen(*region.anchor)
+
         font_size = max(10, min(20, 12 * self.zoom_level))
-        cr.select_font_face("Sans", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+        cr.select_font_face("Sans", cairo.FONT_SLANT_NORMAL,
+                            cairo.FONT_WEIGHT_NORMAL)
         cr.set_font_size(font_size)
-        
+
         text_extents = cr.text_extents(region.name)
+        # Shrink the text to the room around the anchor
+        max_width = region.label_width * self.zoom_level
+        if max_width > 0 and text_extents.width > max_width:
+            font_size = max(MIN_LABEL_FONT_SIZE,
+                            font_size * max_width / text_extents.width)
+            cr.set_font_size(font_size)
+            text_extents = cr.text_extents(region.name)
         text_width = text_extents.width
         text_height = text_extents.height
-        
+
         padding = 2
-        bg_x = center_x - text_width/2 - padding
-        bg_y = center_y - text_height/2 - padding
-        bg_width = text_width + 2*padding
-        bg_height = text_height + 2*padding
-        
+        bg_x = center_x - text_width / 2 - padding
+        bg_y = center_y - text_height / 2 - padding
+        bg_width = text_width + 2 * padding
+        bg_height = text_height + 2 * padding
+
         cr.set_source_rgba(1, 1, 1, 0.8)
         cr.rectangle(bg_x, bg_y, bg_width, bg_height)
         cr.fill()
-        
+
         cr.set_source_rgb(0, 0, 0)
-        cr.move_to(center_x - text_width/2, center_y + text_height/2)
+        cr.move_to(center_x - text_width / 2, center_y + text_height / 2)
         cr.show_text(region.name)
-        
+
     def _draw_completion_overlay(self, cr, width, height):
         """Draw completion celebration overlay"""
         cr.set_source_rgba(0, 0, 0, 0.3)
         cr.rectangle(0, 0, width, height)
         cr.fill()
-        
+
         cr.set_source_rgb(1, 1, 1)
-        cr.select_font_face("Sans", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD)
+        cr.select_font_face("Sans", cairo.FONT_SLANT_NORMAL,
+                            cairo.FONT_WEIGHT_BOLD)
         cr.set_font_size(48)
-        
+
         text = "🎉 Puzzle Complete! 🎉"
         text_extents = cr.text_extents(text)
         x = (width - text_extents.width) / 2
         y = height / 2
-        
+
         cr.move_to(x, y)
         cr.show_text(text)
-        
+
     def save_state(self):
         """Save game state for journal"""
         if not self.current_level:
             return {}
-            
+
         regions_state = {}
         for region_id, region in self.regions.items():
             regions_state[region_id] = region.color_index
-            
+
         return {
             'mode': self.mode.value,
             'current_level': self.current_level,
@@ -400,27 +564,28 @@ class GameEngine:
             'pan_offset': self.pan_offset,
             'history': self.history
         }
-        
+
     def load_state(self, data):
         """Load game state from journal"""
         try:
             if 'current_level' in data and data['current_level']:
                 self.start_level(data['current_level'])
-                
+
                 if 'regions_state' in data:
-                    for region_id, color_index in data['regions_state'].items():
+                    regions_state = data['regions_state']
+                    for region_id, color_index in regions_state.items():
                         if region_id in self.regions:
                             self.regions[region_id].set_color(color_index)
-                            
+
                 self.selected_color = data.get('selected_color', 0)
                 self.eraser_mode = data.get('eraser_mode', False)
                 self.start_time = data.get('start_time')
                 self.zoom_level = data.get('zoom_level', 1.0)
                 self.pan_offset = data.get('pan_offset', [0, 0])
                 self.history = data.get('history', [])
-                
+
                 if 'mode' in data:
                     self.mode = GameMode(data['mode'])
-                    
+
         except Exception as e:
             print(f"Error loading state: {e}")
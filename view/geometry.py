@@ -0,0 +1,150 @@
+# This file is part of the Four Color Map game.
+# Copyright (C) 2025 Bishoy Wadea
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Small polygon helpers shared by the renderer, hit-testing and loaders."""
+
+
+def region_parts(region):
+    """The rings of a region dict: its 'parts', or just its 'points'"""
+    return region.get('parts') or [region.get('points', [])]
+
+
+def region_holes(region):
+    """The holes of each ring of region_parts(), as lists of rings"""
+    return region.get('holes') or [[] for _ in region_parts(region)]
+
+
+def lod_for_scale(lods, scale, max_error=1.0):
+    """
+    The coarsest of a region's 'lods' (finest first) whose 'error', in
+    map units, stays within max_error pixels at scale pixels per map
+    unit, or None when only the full geometry is that close.
+    """
+    chosen = None
+    for lod in lods or ():
+        if lod['error'] * scale > max_error:
+            break
+        chosen = lod
+    return chosen
+
+
+def point_in_polygon(x, y, points):
+    """Point-in-polygon test using ray casting algorithm"""
+    if len(points) < 3:
+        return False
+
+    inside = False
+    xj, yj = points[-1]
+    for xi, yi in points:
+        if ((yi > y) != (yj > y)) and \
+                (x < (xj - xi) * (y - yi) / (yj - yi) + xi):
+            inside = not inside
+        xj, yj = xi, yi
+
+    return inside
+
+
+def point_in_part(x, y, ring, holes=()):
+    """Whether (x, y) is inside a ring and outside all of its holes"""
+    return point_in_polygon(x, y, ring) and \
+        not any(point_in_polygon(x, y, hole) for hole in holes)
+
+
+def polygon_bbox(points):
+    """Return (min_x, min_y, max_x, max_y) of a ring"""
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def polygon_area(points):
+    """Signed area of a ring (shoelace formula)"""
+    area = 0.0
+    xj, yj = points[-1]
+    for xi, yi in points:
+        area += xj * yi - xi * yj
+        xj, yj = xi, yi
+    return area / 2.0
+
+
+def polygon_centroid(points):
+    """Area centroid of a ring, or the vertex mean for degenerate rings"""
+    area = 0.0
+    cx = 0.0
+    cy = 0.0
+    xj, yj = points[-1]
+    for xi, yi in points:
+        cross = xj * yi - xi * yj
+        area += cross
+        cx += (xj + xi) * cross
+        cy += (yj + yi) * cross
+        xj, yj = xi, yi
+
+    if abs(area) < 1e-9:
+        return (sum(p[0] for p in points) / len(points),
+                sum(p[1] for p in points) / len(points))
+    return (cx / (3.0 * area), cy / (3.0 * area))
+
+
+def _crossings(rings, y):
+    """Sorted x coordinates where the rings cross the line at y"""
+    crossings = []
+    for ring in rings:
+        xj, yj = ring[-1]
+        for xi, yi in ring:
+            if (yi > y) != (yj > y):
+                crossings.append((xj - xi) * (y - yi) / (yj - yi) + xi)
+            xj, yj = xi, yi
+    crossings.sort()
+    return crossings
+
+
+def label_anchor(points, holes=()):
+    """
+    Pick a point inside a ring (and outside its holes) to centre its
+    label on.
+
+    Uses the area centroid when it falls inside the ring; for concave
+    shapes where it does not, takes the middle of the widest interior
+    span on the horizontal line through the centroid.
+    """
+    cx, cy = polygon_centroid(points)
+    if point_in_part(cx, cy, points, holes):
+        return (cx, cy)
+
+    crossings = _crossings([points, *holes], cy)
+    best = None
+    for start, end in zip(crossings[0::2], crossings[1::2]):
+        if best is None or end - start > best[1] - best[0]:
+            best = (start, end)
+
+    if best is None:
+        return (cx, cy)
+    return ((best[0] + best[1]) / 2.0, cy)
+
+
+def label_width(points, holes, anchor):
+    """
+    Widest label that fits centred on anchor: twice the distance to the
+    nearer edge of the ring along the horizontal line through it.
+    """
+    x, y = anchor
+    crossings = _crossings([points, *holes], y)
+    for start, end in zip(crossings[0::2], crossings[1::2]):
+        if start <= x <= end:
+            return 2.0 * min(x - start, end - x)
+    return 0.0
@@ -0,0 +1,396 @@
+# This file is part of the Four Color Map game.
+# Copyright (C) 2025 Bishoy Wadea
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+Level loading: external level pack directories and derived level data.
+
+Besides the built-in LEVELS, level packs and region streams (read as
+packs of one level) are picked up from the bundled assets/levels
+directory, the system and user XDG data directories
+(four-color-map/levels) and any directory listed in the
+FOUR_COLOR_MAP_LEVELS environment variable.
+
+Everything the game derives from a level's regions (bounding boxes of
+regions and of each of their parts, adjacency, a grid spatial index
+and label placements) is kept in a LevelIndex. For level packs the index
+is read from a sidecar file written by the level builder
+(<pack>.index.json, checked against the pack's content hash) or else
+cached on disk, keyed by the pack's content hash and INDEX_VERSION, so
+re-opening the activity reads it back instead of re-deriving it. A
+missing, stale or corrupt index is simply rebuilt.
+"""
+
+import hashlib
+import json
+import os
+
+from view.adjacency import AdjacencyGraph, apply_derived_neighbors
+from view.geometry import (
+    label_anchor, label_width, point_in_part, polygon_bbox, region_holes,
+    region_parts)
+from view.level_pack import (
+    PACK_EXTENSION, STREAM_EXTENSION, parse_level_pack)
+
+INDEX_VERSION = 5
+INDEX_SUFFIX = '.index.json'
+GRID_SIZE = 16
+
+BUNDLED_LEVELS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'assets', 'levels')
+
+
+class LevelIndex:
+    """Lookup data derived from a level's regions"""
+
+    def __init__(self, ids, bboxes, part_bboxes, graph, anchors,
+                 label_widths, grid):
+        self.ids = ids
+        self.bboxes = bboxes
+        self.part_bboxes = part_bboxes
+        self.graph = graph
+        self.anchors = anchors
+        self.label_widths = label_widths
+        self.grid = grid
+        self.positions = graph.positions
+
+    @classmethod
+    def build(cls, regions):
+        """Derive the index from a list of region dicts"""
+        ids = []
+        bboxes = []
+        part_bboxes = []
+        anchors = []
+        label_widths = []
+        for region in regions:
+            points = region.get('points', [])
+            ids.append(region['id'])
+            boxes = [list(polygon_bbox(ring)) if len(ring) >= 3 else None
+                     for ring in region_parts(region)]
+            part_bboxes.append(boxes)
+            boxes = [box for box in boxes if box]
+            if boxes:
+                bboxes.append([min(box[0] for box in boxes),
+                               min(box[1] for box in boxes),
+                               max(box[2] for box in boxes),
+                               max(box[3] for box in boxes)])
+            else:
+                bboxes.append(None)
+            # Imported levels store their label placement; otherwise the
+            # label goes in the first part, the main one
+            if 'label' in region:
+                anchors.append(list(region['label']))
+                label_widths.append(region.get('label_width', 0.0))
+            elif len(points) >= 3:
+                holes = region_holes(region)[0]
+                anchor = label_anchor(points, holes)
+                anchors.append(list(anchor))
+                label_widths.append(label_width(points, holes, anchor))
+            else:
+                anchors.append(None)
+                label_widths.append(0.0)
+
+        graph = AdjacencyGraph.from_regions(regions)
+        return cls(ids, bboxes, part_bboxes, graph, anchors, label_widths,
+                   _build_grid(part_bboxes))
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError("level index version mismatch")
+        count = len(data['ids'])
+        if any(len(data[key]) != count
+               for key in ('bboxes', 'part_bboxes', 'anchors',
+                           'label_widths')):
+            raise ValueError("level index is inconsistent")
+        graph = AdjacencyGraph(data['ids'], data['neighbor_offsets'],
+                               data['neighbor_indices'],
+                               weights=data['neighbor_weights'])
+        return cls(data['ids'], data['bboxes'], data['part_bboxes'], graph,
+                   data['anchors'], data['label_widths'], data['grid'])
+
+    def to_dict(self):
+        return {
+            'version': INDEX_VERSION,
+            'ids': self.ids,
+            'bboxes': self.bboxes,
+            'part_bboxes': self.part_bboxes,
+            'neighbor_offsets': self.graph.offsets.tolist(),
+            'neighbor_indices': self.graph.indices.tolist(),
+            'neighbor_weights': (self.graph.weights.tolist()
+                                 if self.graph.weights is not None
+                                 else None),
+            'anchors': self.anchors,
+            'label_widths': self.label_widths,
+            'grid': self.grid,
+        }
+
+    def candidates_at(self, x, y):
+        """Positions of the regions whose grid cell contains (x, y)"""
+        grid = self.grid
+        if not grid:
+            return []
+        col = int((x - grid['x']) / grid['cell_width'])
+        row = int((y - grid['y']) / grid['cell_height'])
+        if not (0 <= col < grid['cols'] and 0 <= row < grid['rows']):
+            return []
+        return grid['cells'][row * grid['cols'] + col]
+
+    def regions_at(self, regions, x, y):
+        """Yield the region dicts containing (x, y), in level order"""
+        for position in self.candidates_at(x, y):
+            min_x, min_y, max_x, max_y = self.bboxes[position]
+            if not (min_x <= x <= max_x and min_y <= y <= max_y):
+                continue
+            region = regions[position]
+            rings = region_parts(region)
+            holes = region.get('holes') or ((),) * len(rings)
+            for ring, ring_holes, box in zip(
+                    rings, holes, self.part_bboxes[position]):
+                if box and box[0] <= x <= box[2] and \
+                        box[1] <= y <= box[3] and \
+                        point_in_part(x, y, ring, ring_holes):
+                    yield region
+                    break
+
+
+def _build_grid(part_bboxes):
+    """
+    Bucket regions into a uniform grid by the bounding boxes of their
+    parts, so a far-away island only adds the region to its own cells.
+    """
+    boxes = [box for boxes in part_bboxes for box in boxes if box]
+    if not boxes:
+        return None
+
+    min_x = min(box[0] for box in boxes)
+    min_y = min(box[1] for box in boxes)
+    max_x = max(box[2] for box in boxes)
+    max_y = max(box[3] for box in boxes)
+    cols = rows = GRID_SIZE
+    cell_width = max(max_x - min_x, 1) / cols
+    cell_height = max(max_y - min_y, 1) / rows
+
+    cells = [[] for _ in range(cols * rows)]
+    for position, boxes in enumerate(part_bboxes):
+        for box in boxes:
+            if not box:
+                continue
+            col_start = min(int((box[0] - min_x) / cell_width), cols - 1)
+            col_end = min(int((box[2] - min_x) / cell_width), cols - 1)
+            row_start = min(int((box[1] - min_y) / cell_height), rows - 1)
+            row_end = min(int((box[3] - min_y) / cell_height), rows - 1)
+            for row in range(row_start, row_end + 1):
+                for col in range(col_start, col_end + 1):
+                    cell = cells[row * cols + col]
+                    if not cell or cell[-1] != position:
+                        cell.append(position)
+
+    return {
+        'x': min_x,
+        'y': min_y,
+        'cell_width': cell_width,
+        'cell_height': cell_height,
+        'cols': cols,
+        'rows': rows,
+        'cells': cells,
+    }
+
+
+def get_level_regions(level, derive_neighbors=None):
+    """
+    Return the region dicts of a LEVELS entry.
+
+    When derive_neighbors is true (by default, when the entry sets
+    'derive_neighbors'), the declared neighbour lists are replaced by ones
+    computed from shared borders, matched within the entry's
+    'neighbor_tolerance'.
+    """
+    if 'data_func' in level:
+        regions = level['data_func']()
+    else:
+        regions = level.get('regions', [])
+
+    if derive_neighbors is None:
+        derive_neighbors = level.get('derive_neighbors', False)
+    if derive_neighbors:
+        regions = apply_derived_neighbors(
+            regions, level.get('neighbor_tolerance', 0))
+    return regions
+
+
+def get_level_index(level, regions=None):
+    """Return the LevelIndex of a LEVELS entry, building it if needed"""
+    if 'index_func' in level:
+        return level['index_func']()
+    if regions is None:
+        regions = get_level_regions(level)
+    index = LevelIndex.build(regions)
+    _report_adjacency_issues(level, index.graph)
+    return index
+
+
+def _report_adjacency_issues(level, graph):
+    for kind, items in graph.issues.items():
+        print(f"Level {level.get('name')}: {len(items)} {kind} "
+              f"neighbour entries fixed at load: {items[:5]}")
+
+
+def cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'four-color-map')
+
+
+def level_pack_dirs():
+    """Directories searched for level packs, in load order"""
+    dirs = [BUNDLED_LEVELS_DIR]
+
+    data_dirs = os.environ.get('XDG_DATA_DIRS') or \
+        '/usr/local/share:/usr/share'
+    for data_dir in reversed(data_dirs.split(os.pathsep)):
+        if data_dir:
+            dirs.append(os.path.join(data_dir, 'four-color-map', 'levels'))
+
+    data_home = os.environ.get('XDG_DATA_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.local', 'share')
+    dirs.append(os.path.join(data_home, 'four-color-map', 'levels'))
+
+    extra = os.environ.get('FOUR_COLOR_MAP_LEVELS', '')
+    dirs.extend(path for path in extra.split(os.pathsep) if path)
+
+    unique = []
+    for path in dirs:
+        path = os.path.abspath(path)
+        if path not in unique:
+            unique.append(path)
+    return unique
+
+
+def _read_cached_indices(path, count, digest=None):
+    """
+    Read a list of level indices, or None if unusable.
+
+    With a digest, the file is a pack index sidecar and must name the
+    pack's content hash.
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        if digest is not None:
+            if data.get('sha1') != digest:
+                return None
+            data = data['levels']
+        indices = [LevelIndex.from_dict(item) for item in data]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    if len(indices) != count:
+        return None
+    return indices
+
+
+def _write_cached_indices(path, indices, digest=None):
+    data = [index.to_dict() for index in indices]
+    if digest is not None:
+        data = {'sha1': digest, 'levels': data}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not write level cache {path}: {e}")
+
+
+def write_pack_index(path):
+    """
+    Write the index sidecar of a level pack (<pack>.index.json).
+
+    The activity then reads the index instead of building it on first
+    use; the sidecar is ignored once the pack changes.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    indices = [LevelIndex.build(get_level_regions(level))
+               for level in parse_level_pack(data, path)]
+    _write_cached_indices(path + INDEX_SUFFIX, indices,
+                          hashlib.sha1(data).hexdigest())
+    return path + INDEX_SUFFIX
+
+
+def _attach_cached_index(levels, cache_path, index_path=None, digest=None):
+    """
+    Give each pack level an 'index_func' backed by the pack's index
+    sidecar, if any, or else the disk cache.
+    """
+    state = {}
+
+    def load_indices():
+        if 'indices' not in state:
+            indices = None
+            if index_path is not None:
+                indices = _read_cached_indices(
+                    index_path, len(levels), digest)
+            if indices is None:
+                indices = _read_cached_indices(cache_path, len(levels))
+            if indices is None:
+                indices = []
+                for level in levels:
+                    index = LevelIndex.build(get_level_regions(level))
+                    _report_adjacency_issues(level, index.graph)
+                    indices.append(index)
+                _write_cached_indices(cache_path, indices)
+            state['indices'] = indices
+        return state['indices']
+
+    for position, level in enumerate(levels):
+        level['index_func'] = \
+            lambda position=position: load_indices()[position]
+
+
+def load_level_pack_file(path):
+    """Read a level pack, wiring its levels to the on-disk index cache"""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    levels = parse_level_pack(data, path)
+    digest = hashlib.sha1(data).hexdigest()
+    cache_path = os.path.join(
+        cache_dir(), f"{digest}-v{INDEX_VERSION}.json")
+    _attach_cached_index(levels, cache_path, path + INDEX_SUFFIX, digest)
+    for level in levels:
+        level['pack'] = path
+    return levels
+
+
+def load_external_levels(dirs=None):
+    """Read every level pack found in the level pack directories"""
+    levels = []
+    for directory in dirs if dirs is not None else level_pack_dirs():
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith((PACK_EXTENSION, STREAM_EXTENSION)):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                levels.extend(load_level_pack_file(path))
+            except (OSError, ValueError, IndexError) as e:
+                print(f"Skipping level pack {path}: {e}")
+
+    return levels
@@ -0,0 +1,653 @@
+# This file is part of the Four Color Map game.
+# Copyright (C) 2025 Bishoy Wadea
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+Compact binary level packs.
+
+A pack holds any number of levels. Each level stores its metadata,
+region names and label placements as JSON, the rest of its region table
+(ids, neighbours, ring sizes) as one block of varints, and a single
+coordinate block: every vertex of every ring, quantized to integers,
+delta-encoded against the previous vertex of the level and written as
+zigzag varints with x and y interleaved. Because the deltas run across
+ring boundaries, decoding a whole level is one varint pass plus one
+running sum per axis, which NumPy does in bulk when it is available.
+
+Decoded coordinates stay in two flat buffers; region rings are
+PointRing views over them, so no per-vertex tuples are built until a
+ring is actually iterated.
+
+Layout (all integers are unsigned LEB128 varints unless noted):
+
+    b"FCMP" version:u8 level_count
+    level_count * (level_size level)
+
+    level := meta_len meta_json table_len table coord_len coords
+    table := region_count
+             region_count * (id neighbor_count neighbor_delta*
+                             has_lengths border_length*
+                             part_count part*
+                             lod_count lod*)
+    part  := point_count hole_count hole_point_count*
+    lod   := part_count part*
+
+meta_json holds the level metadata plus 'names', one per region, and,
+when any region has a 'label', 'labels': one [x, y, label_width] or
+null per region, and, when any region has 'lods', 'lod_errors': the
+'error' of each of a region's lods. has_lengths is 1 when the region has
+'border_lengths', followed by the border shared with each neighbour in
+whole map units, and 0 otherwise. The lods are coarser copies of the
+region's parts, finest first, for drawing it zoomed out.
+A part's holes (interior rings) follow its own points in the coordinate
+block, and a region's lods follow its parts. Older packs are still
+read: version 3 has no lods, version 2 no border lengths either, and
+version 1 neither those nor hole counts (part := point_count).
+
+A region stream holds a single level written one region at a time
+(see RegionStreamWriter). Each region gets a table and a coordinate
+block of its own, and a footer at the end holds the level's meta_json
+and indexes the records, so any region can be read without decoding
+the others (see RegionStream):
+
+    b"FCMR" version:u8 region_record* footer footer_size:u32le b"FCMR"
+
+    region_record := table_len table coord_len coords
+    footer        := meta_len meta_json region_count record_size*
+
+where version is the PACK_VERSION of the tables and each table holds a
+single region. A stream that lacks the closing b"FCMR", such as one
+whose writer failed, is rejected.
+"""
+
+import json
+import math
+import os
+import struct
+from array import array
+from itertools import accumulate
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PACK_MAGIC = b"FCMP"
+PACK_VERSION = 4
+READABLE_VERSIONS = (1, 2, 3, 4)
+PACK_EXTENSION = ".fcmp"
+STREAM_MAGIC = b"FCMR"
+STREAM_EXTENSION = ".fcmr"
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _write_varint(out, value):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class PointRing:
+    """Read-only sequence of (x, y) points backed by flat coordinate arrays."""
+
+    __slots__ = ('_xs', '_ys', '_start', '_stop')
+
+    def __init__(self, xs, ys, start, stop):
+        self._xs = xs
+        self._ys = ys
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __iter__(self):
+        return zip(self._xs[self._start:self._stop],
+                   self._ys[self._start:self._stop])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("point index out of range")
+        index += self._start
+        return (self._xs[index], self._ys[index])
+
+    def __repr__(self):
+        return f"PointRing({list(self)!r})"
+
+
+def _region_parts(region):
+    """Return the list of point rings that make up a region."""
+    parts = region.get('parts')
+    if parts:
+        return parts
+    return [region.get('points', [])]
+
+
+def _write_ring(coords, ring, scale, last):
+    """Append a ring's zigzag deltas; last is the previous (x, y)"""
+    last_x, last_y = last
+    for x, y in ring:
+        qx = int(round(x * scale))
+        qy = int(round(y * scale))
+        _write_varint(coords, _zigzag(qx - last_x))
+        _write_varint(coords, _zigzag(qy - last_y))
+        last_x = qx
+        last_y = qy
+    return last_x, last_y
+
+
+def _write_parts(table, coords, parts, holes, scale, last):
+    """Append the ring sizes and the points of parts and their holes"""
+    holes = holes or [[] for _ in parts]
+    _write_varint(table, len(parts))
+    for part, part_holes in zip(parts, holes):
+        _write_varint(table, len(part))
+        _write_varint(table, len(part_holes))
+        for hole in part_holes:
+            _write_varint(table, len(hole))
+        last = _write_ring(coords, part, scale, last)
+        for hole in part_holes:
+            last = _write_ring(coords, hole, scale, last)
+    return last
+
+
+def encode_level(regions, meta=None, scale=None):
+    """
+    Encode a list of region dicts into a level record.
+
+    Args:
+        regions: Region dicts as returned by the level data functions
+        meta: Level metadata (name, tag, description, ...) stored as JSON
+        scale: Quantization units per map unit; coordinates are stored as
+            round(value * scale) and decoded as stored / scale (default
+            1, whole map units)
+    """
+    scale = scale or 1
+    meta = _level_meta(
+        meta, scale,
+        [str(region.get('name', '')) for region in regions],
+        [_label_entry(region) for region in regions],
+        [_lod_errors(region) for region in regions])
+    table, coords = _encode_regions(regions, scale)
+
+    out = bytearray()
+    for block in (json.dumps(meta, sort_keys=True).encode('utf-8'),
+                  table, coords):
+        _write_varint(out, len(block))
+        out += block
+    return bytes(out)
+
+
+def _label_entry(region):
+    """A region's [x, y, label_width] in the 'labels' meta, or None"""
+    if 'label' not in region:
+        return None
+    return [*region['label'], region.get('label_width')]
+
+
+def _lod_errors(region):
+    """The 'error' of each of a region's lods"""
+    return [lod['error'] for lod in region.get('lods') or ()]
+
+
+def _level_meta(meta, scale, names, labels, lod_errors):
+    """Level metadata plus the per-region lists stored with it"""
+    meta = dict(meta or {})
+    meta['scale'] = scale
+    meta['names'] = names
+    if any(label is not None for label in labels):
+        meta['labels'] = labels
+    if any(lod_errors):
+        meta['lod_errors'] = lod_errors
+    return meta
+
+
+def _encode_regions(regions, scale):
+    """The table and coordinate blocks of a level's regions"""
+    table = bytearray()
+    coords = bytearray()
+    _write_varint(table, len(regions))
+    last = (0, 0)
+    for region in regions:
+        _write_varint(table, region['id'])
+
+        declared = region.get('neighbors', [])
+        neighbors = sorted(set(declared))
+        _write_varint(table, len(neighbors))
+        previous = 0
+        for neighbor in neighbors:
+            _write_varint(table, neighbor - previous)
+            previous = neighbor
+
+        lengths = region.get('border_lengths')
+        _write_varint(table, int(lengths is not None))
+        if lengths is not None:
+            by_neighbor = dict(zip(declared, lengths))
+            for neighbor in neighbors:
+                _write_varint(table, int(math.ceil(by_neighbor[neighbor])))
+
+        last = _write_parts(table, coords, _region_parts(region),
+                            region.get('holes'), scale, last)
+        lods = region.get('lods') or ()
+        _write_varint(table, len(lods))
+        for lod in lods:
+            last = _write_parts(table, coords, lod['parts'],
+                                lod.get('holes'), scale, last)
+    return table, coords
+
+
+def _read_block(data, pos):
+    size, pos = _read_varint(data, pos)
+    return data[pos:pos + size], pos + size
+
+
+def _decode_varints(block):
+    """Decode a block of unsigned varints (a NumPy array if available)."""
+    if numpy is not None:
+        raw = numpy.frombuffer(block, dtype=numpy.uint8)
+        ends = numpy.flatnonzero(raw < 0x80)
+        if len(ends) == len(raw):
+            return raw.astype(numpy.int64)
+        starts = numpy.empty_like(ends)
+        starts[:1] = 0
+        starts[1:] = ends[:-1] + 1
+        lengths = ends - starts
+        low = (raw & 0x7f).astype(numpy.int64)
+        values = low[starts]
+        # Fold in the continuation bytes, one byte position at a time
+        for k in range(1, int(lengths.max()) + 1):
+            more = numpy.flatnonzero(lengths >= k)
+            values[more] |= low[starts[more] + k] << (7 * k)
+        return values
+
+    if max(block, default=0) < 0x80:
+        # Every value fits in a single byte
+        return list(block)
+    # _read_varint() inlined: a call per value would cost more than
+    # the decoding itself
+    values = []
+    append = values.append
+    value = shift = 0
+    for byte in block:
+        if byte < 0x80:
+            append(value | byte << shift)
+            value = shift = 0
+        else:
+            value |= (byte & 0x7f) << shift
+            shift += 7
+    return values
+
+
+def _decode_coords(block, scale):
+    """Decode an interleaved zigzag-delta varint block into xs, ys buffers."""
+    values = _decode_varints(block)
+    if numpy is not None:
+        values = (values >> 1) ^ -(values & 1)
+        xs = numpy.cumsum(values[0::2])
+        ys = numpy.cumsum(values[1::2])
+        if scale != 1:
+            return (array('d', (xs / scale).tobytes()),
+                    array('d', (ys / scale).tobytes()))
+        return array('q', xs.tobytes()), array('q', ys.tobytes())
+
+    values = [(v >> 1) ^ -(v & 1) for v in values]
+    xs = accumulate(values[0::2])
+    ys = accumulate(values[1::2])
+    if scale != 1:
+        return (array('d', (x / scale for x in xs)),
+                array('d', (y / scale for y in ys)))
+    return array('q', xs), array('q', ys)
+
+
+def _read_parts(table, index, xs, ys, offset, version):
+    """
+    Read the parts written by _write_parts() as PointRing views.
+
+    Returns (parts, holes, index, offset), with index and offset moved
+    past them in the table and the coordinate buffers.
+    """
+    part_count = table[index]
+    index += 1
+    parts = []
+    holes = []
+    for _ in range(part_count):
+        stop = offset + table[index]
+        parts.append(PointRing(xs, ys, offset, stop))
+        offset = stop
+        part_holes = []
+        if version > 1:
+            hole_count = table[index + 1]
+            index += 2
+            if hole_count:
+                for size in table[index:index + hole_count]:
+                    part_holes.append(
+                        PointRing(xs, ys, offset, offset + size))
+                    offset += size
+                index += hole_count
+        else:
+            index += 1
+        holes.append(part_holes)
+    return parts, holes, index, offset
+
+
+def decode_level(data, pos=0, version=PACK_VERSION):
+    """
+    Decode a level record.
+
+    Returns a (meta, regions) tuple where regions are dicts in the same
+    shape as the ones returned by the level data functions, with their
+    rings as PointRing views. Regions with holes also get 'holes', one
+    list of rings per part, and regions stored with border lengths, a
+    label placement or coarser copies get 'border_lengths', 'label' and
+    'label_width', or 'lods': dicts of 'error', 'parts' and, with holes,
+    'holes'.
+    """
+    meta_block, pos = _read_block(data, pos)
+    table_block, pos = _read_block(data, pos)
+    coord_block, pos = _read_block(data, pos)
+
+    meta = json.loads(bytes(meta_block).decode('utf-8'))
+    names = meta.pop('names', [])
+    labels = meta.pop('labels', None) or []
+    lod_errors = meta.pop('lod_errors', None) or []
+    return meta, _decode_regions(table_block, coord_block,
+                                 meta.get('scale', 1), names, labels,
+                                 lod_errors, version)
+
+
+def _decode_regions(table_block, coord_block, scale, names, labels,
+                    lod_errors, version):
+    """
+    Region dicts from a table and a coordinate block; names, labels and
+    lod_errors are the level meta's lists for the same regions.
+    """
+    table = _decode_varints(table_block)
+    if numpy is not None:
+        table = table.tolist()
+    xs, ys = _decode_coords(coord_block, scale)
+
+    regions = []
+    index = 1
+    offset = 0
+    for i in range(table[0] if table else 0):
+        region_id = table[index]
+        neighbor_count = table[index + 1]
+        index += 2
+        neighbors = list(accumulate(table[index:index + neighbor_count]))
+        index += neighbor_count
+        lengths = None
+        if version > 2:
+            has_lengths = table[index]
+            index += 1
+            if has_lengths:
+                lengths = table[index:index + neighbor_count]
+                index += neighbor_count
+
+        parts, holes, index, offset = _read_parts(
+            table, index, xs, ys, offset, version)
+        lods = []
+        if version > 3:
+            lod_count = table[index]
+            index += 1
+            for k in range(lod_count):
+                lod_parts, lod_holes, index, offset = _read_parts(
+                    table, index, xs, ys, offset, version)
+                lod = {'error': lod_errors[i][k], 'parts': lod_parts}
+                if any(lod_holes):
+                    lod['holes'] = lod_holes
+                lods.append(lod)
+
+        region = {
+            'id': region_id,
+            'name': names[i] if i < len(names) else f"Region {region_id}",
+            'points': parts[0] if parts else [],
+            'neighbors': neighbors,
+        }
+        if lengths is not None:
+            region['border_lengths'] = lengths
+        if i < len(labels) and labels[i]:
+            label_x, label_y, width = labels[i]
+            region['label'] = (label_x, label_y)
+            region['label_width'] = width
+        if len(parts) > 1:
+            region['parts'] = parts
+        if any(holes):
+            region['holes'] = holes
+        if lods:
+            region['lods'] = lods
+        regions.append(region)
+
+    return regions
+
+
+def write_level_pack(path, levels):
+    """
+    Write a level pack.
+
+    Args:
+        path: Output file path
+        levels: Iterable of (meta, regions) pairs, or of already encoded
+            level records (bytes)
+    """
+    records = []
+    for level in levels:
+        if isinstance(level, (bytes, bytearray)):
+            records.append(bytes(level))
+        else:
+            meta, regions = level
+            records.append(encode_level(regions, meta))
+
+    out = bytearray(PACK_MAGIC)
+    out.append(PACK_VERSION)
+    _write_varint(out, len(records))
+    for record in records:
+        _write_varint(out, len(record))
+        out += record
+
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def read_level_pack(path):
+    """Read a level pack file and return LEVELS-style entries."""
+    with open(path, "rb") as f:
+        return parse_level_pack(f.read(), path)
+
+
+def parse_level_pack(data, path="<level pack>"):
+    """
+    Parse level pack bytes into LEVELS-style entries.
+
+    Level geometry is decoded on the first call to each entry's
+    'data_func' and reused afterwards. Region streams are read as packs
+    of one level.
+    """
+    if data[:4] == STREAM_MAGIC:
+        stream = RegionStream(data, path)
+        level = dict(stream.meta)
+        level['data_func'] = _lazy_decoder(stream)
+        return [level]
+    if data[:4] != PACK_MAGIC:
+        raise ValueError(f"{path} is not a level pack")
+    version = data[4]
+    if version not in READABLE_VERSIONS:
+        raise ValueError(
+            f"{path}: unsupported level pack version {version}")
+
+    view = memoryview(data)
+    count, pos = _read_varint(data, 5)
+    levels = []
+    for _ in range(count):
+        size, pos = _read_varint(data, pos)
+        record = view[pos:pos + size]
+        pos += size
+
+        meta_block, _ = _read_block(record, 0)
+        meta = json.loads(bytes(meta_block).decode('utf-8'))
+        level = {key: value for key, value in meta.items()
+                 if key not in ('scale', 'names', 'labels',
+                                'lod_errors')}
+        level['data_func'] = _lazy_decoder(record, version)
+        levels.append(level)
+
+    return levels
+
+
+def _lazy_decoder(record, version=None):
+    cache = []
+
+    def data_func():
+        if not cache:
+            if isinstance(record, RegionStream):
+                cache.append(record.regions())
+            else:
+                cache.append(decode_level(record, version=version)[1])
+        return cache[0]
+
+    return data_func
+
+
+class RegionStreamWriter:
+    """
+    Write a level as a region stream (see the module docstring), one
+    region at a time.
+
+    Regions are encoded and written as they are passed to write(), and
+    the footer by close(), which leaving a with block calls. Leaving it
+    with an exception removes the unfinished file instead.
+    """
+
+    def __init__(self, path, meta=None, scale=None):
+        self.path = path
+        self.meta = dict(meta or {})
+        self.scale = scale or 1
+        self._sizes = []
+        self._names = []
+        self._labels = []
+        self._lod_errors = []
+        self._file = open(path, "wb")
+        self._file.write(STREAM_MAGIC + bytes([PACK_VERSION]))
+
+    def write(self, region):
+        table, coords = _encode_regions([region], self.scale)
+        record = bytearray()
+        for block in (table, coords):
+            _write_varint(record, len(block))
+            record += block
+        self._file.write(record)
+        self._sizes.append(len(record))
+        self._names.append(str(region.get('name', '')))
+        self._labels.append(_label_entry(region))
+        self._lod_errors.append(_lod_errors(region))
+
+    def close(self):
+        if self._file.closed:
+            return
+        meta = _level_meta(self.meta, self.scale, self._names,
+                           self._labels, self._lod_errors)
+        footer = bytearray()
+        meta_json = json.dumps(meta, sort_keys=True).encode('utf-8')
+        _write_varint(footer, len(meta_json))
+        footer += meta_json
+        _write_varint(footer, len(self._sizes))
+        for size in self._sizes:
+            _write_varint(footer, size)
+        self._file.write(footer)
+        self._file.write(struct.pack("<I", len(footer)) + STREAM_MAGIC)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif not self._file.closed:
+            self._file.close()
+            os.remove(self.path)
+
+
+class RegionStream:
+    """
+    Random access to the regions of a region stream.
+
+    data can be bytes or any buffer over the file, such as an mmap;
+    only the footer is read up front, and region(i) decodes one region.
+    """
+
+    def __init__(self, data, path="<region stream>"):
+        if len(data) < 13 or data[:4] != STREAM_MAGIC:
+            raise ValueError(f"{path} is not a region stream")
+        if data[-4:] != STREAM_MAGIC:
+            raise ValueError(f"{path}: region stream is truncated")
+        self.version = data[4]
+        if self.version not in READABLE_VERSIONS:
+            raise ValueError(
+                f"{path}: unsupported region stream version {self.version}")
+
+        self._view = memoryview(data)
+        footer_size = struct.unpack("<I", bytes(data[-8:-4]))[0]
+        footer = bytes(data[len(data) - 8 - footer_size:-8])
+        meta_len, pos = _read_varint(footer, 0)
+        self.meta = json.loads(footer[pos:pos + meta_len].decode('utf-8'))
+        self.scale = self.meta.pop('scale', 1)
+        self._names = self.meta.pop('names', [])
+        self._labels = self.meta.pop('labels', None) or []
+        self._lod_errors = self.meta.pop('lod_errors', None) or []
+        pos += meta_len
+        count, pos = _read_varint(footer, pos)
+        self._offsets = [5]
+        for _ in range(count):
+            size, pos = _read_varint(footer, pos)
+            self._offsets.append(self._offsets[-1] + size)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def region(self, position):
+        """Decode the region at a position in the stream"""
+        record = self._view[self._offsets[position]:
+                            self._offsets[position + 1]]
+        table_block, pos = _read_block(record, 0)
+        coord_block, _ = _read_block(record, pos)
+        entry = slice(position, position + 1)
+        return _decode_regions(
+            table_block, coord_block, self.scale, self._names[entry],
+            self._labels[entry], self._lod_errors[entry], self.version)[0]
+
+    def regions(self):
+        """Decode every region, in stream order"""
+        return [self.region(position) for position in range(len(self))]
@@ -15,6 +15,7 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
 from view.game_engine import Config
+from view.level_loader import load_external_levels
 import math
 
 
@@ -7704,14 +7705,17 @@ LEVELS = [
         'tag': "polygons",
         'name': 'Simple Map',
         'description': '6 regions - Easy',
-        'data_func': get_level_1
+        'data_func': get_level_1,
+        'derive_neighbors': True
     },
     {
         'id': 2,
         'tag': "polygons",
         'name': 'pizza',
         'description': '8 regions - Medium',
-        'data_func': get_level_2
+        'data_func': get_level_2,
+        'derive_neighbors': True,
+        'neighbor_tolerance': 2
     },
     {
         'id': 3,
@@ -7749,3 +7753,7 @@ LEVELS = [
         'data_func': get_level_7
     }
 ]
+
+# Level packs from the bundle and the user/system level directories
+# (see view/level_loader.py)
+LEVELS.extend(load_external_levels())